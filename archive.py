@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Raw page archive - the HTML of every exam and ket-qua page, kept so the
+extractors can be re-run offline (main.py --replay) after a markup change or
+an extractor fix, without crawling the site again.
+
+Pages are appended to segment files as independently compressed records
+(one zstd frame, or gzip member without zstandard), each a JSON header line
+followed by the HTML. index.sqlite maps (exam_type, exam_id, kind) to the
+latest record's segment, offset and length for random access.
+"""
+
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # falls back to gzip segments
+
+KIND_EXAM = "exam"
+KIND_RESULT = "result"
+
+SEGMENT_BYTES = 1 << 30
+
+
+class ArchiveEntry(NamedTuple):
+    exam_type: str
+    exam_id: int
+    kind: str
+    url: str
+    fetched_at: str
+    segment: str
+    offset: int
+    length: int
+
+
+def read_page(root: str, segment: str, offset: int, length: int) -> Tuple[Dict, str]:
+    """Header and HTML of one record; safe to call from worker processes"""
+    with open(os.path.join(root, segment), 'rb') as f:
+        f.seek(offset)
+        blob = f.read(length)
+    if segment.endswith(".zst"):
+        raw = zstandard.ZstdDecompressor().decompress(blob)
+    else:
+        raw = gzip.decompress(blob)
+    header, _, html = raw.decode("utf-8").partition("\n")
+    return json.loads(header), html
+
+
+class PageArchive:
+    """Append-only page archive; each process writes its own segment files.
+
+    add() may be called from several threads (the crawl runs it off the
+    event loop); a lock keeps the appends and index rows in order.
+    """
+
+    def __init__(self, root: str, segment_bytes: int = SEGMENT_BYTES):
+        self.root = root
+        self.segment_bytes = segment_bytes
+        self.codec = "zst" if zstandard else "gz"
+        self._compressor = zstandard.ZstdCompressor(level=10) if zstandard else None
+        self._file = None
+        self._segment: Optional[str] = None
+        self._count = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                exam_type TEXT NOT NULL,
+                exam_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                url TEXT NOT NULL,
+                fetched_at TEXT NOT NULL,
+                segment TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                PRIMARY KEY (exam_type, exam_id, kind)
+            )
+        """)
+        self.conn.commit()
+
+    def _open_segment(self):
+        if self._file:
+            self._file.close()
+        self._count += 1
+        self._segment = f"pages-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._count:03d}.{self.codec}"
+        self._file = open(os.path.join(self.root, self._segment), 'ab')
+
+    def add(self, exam_type: str, exam_id: int, kind: str, url: str, html: str):
+        """Append a page; it replaces any earlier copy in the index"""
+        fetched_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+        header = json.dumps({"exam_type": exam_type, "exam_id": exam_id, "kind": kind,
+                             "url": url, "fetched_at": fetched_at}, ensure_ascii=False)
+        raw = f"{header}\n{html}".encode("utf-8")
+        with self._lock:
+            # The compressor object is not safe for concurrent use either
+            blob = self._compressor.compress(raw) if self._compressor else gzip.compress(raw)
+            if self._file is None or self._file.tell() >= self.segment_bytes:
+                self._open_segment()
+            offset = self._file.tell()
+            self._file.write(blob)
+            self._file.flush()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (exam_type, exam_id, kind, url, fetched_at, self._segment, offset, len(blob)))
+            self.conn.commit()
+
+    def entries(self, exam_type: str, kind: str = KIND_EXAM) -> List[ArchiveEntry]:
+        rows = self.conn.execute(
+            "SELECT * FROM pages WHERE exam_type = ? AND kind = ? ORDER BY exam_id", (exam_type, kind))
+        return [ArchiveEntry(*row) for row in rows]
+
+    def close(self):
+        if self._file:
+            self._file.close()
+        self.conn.close()
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Listening audio downloads - content-addressed and resumable
+Files are stored once per content hash (audio/<ab>/<sha256>.mp3) however many
+exams use them; interrupted downloads continue from a .part file via Range
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+
+from httpsession import CookieSession
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+ATTEMPTS = 3
+
+
+class AudioDownloader(CookieSession):
+    """Downloads audio over a pooled session carrying the login cookies.
+
+    At most `concurrency` files are fetched at once; the same URL requested
+    by several exams is downloaded once. The URL -> file index is kept in
+    the manifest database so later runs skip finished files.
+    """
+
+    def __init__(self, root: str, index_path: str, concurrency: int = 4,
+                 user_agent: Optional[str] = None):
+        self.root = root
+        self.concurrency = max(1, concurrency)
+        super().__init__(self.concurrency, user_agent)
+        self.partial_dir = os.path.join(root, ".partial")
+        os.makedirs(self.partial_dir, exist_ok=True)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        directory = os.path.dirname(index_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(index_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS audio_files (
+                url TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                path TEXT NOT NULL,
+                bytes INTEGER NOT NULL,
+                downloaded_at TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def _known(self, url: str) -> Optional[Dict]:
+        row = self.conn.execute(
+            "SELECT sha256, path, bytes FROM audio_files WHERE url = ?", (url,)).fetchone()
+        if row and os.path.exists(os.path.join(self.root, row[1])):
+            return {"sha256": row[0], "path": row[1], "bytes": row[2]}
+        return None
+
+    def _fetch(self, url: str, part_path: str):
+        """Stream url into part_path, continuing from its current size"""
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        with self.session.get(url, headers=headers, stream=True,
+                              timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)) as response:
+            if response.status_code == 416 and offset:
+                return  # the partial file is already complete
+            response.raise_for_status()
+            if response.status_code != 206:
+                offset = 0  # Range ignored, start over
+
+            total = None
+            content_range = response.headers.get("Content-Range", "")
+            if response.status_code == 206 and "/" in content_range:
+                size = content_range.rsplit("/", 1)[1]
+                total = int(size) if size.isdigit() else None
+            elif response.headers.get("Content-Length", "").isdigit():
+                total = int(response.headers["Content-Length"])
+
+            with open(part_path, 'ab' if offset else 'wb') as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+
+        if total is not None and os.path.getsize(part_path) != total:
+            raise IOError(f"incomplete download ({os.path.getsize(part_path)}/{total} bytes)")
+
+    def _download(self, url: str) -> Dict:
+        """Blocking download; returns the stored file's path, sha256 and size"""
+        part_path = os.path.join(self.partial_dir, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".part")
+        for attempt in range(1, ATTEMPTS + 1):
+            try:
+                self._fetch(url, part_path)
+                break
+            except (requests.RequestException, IOError) as e:
+                if attempt == ATTEMPTS:
+                    raise
+                logger.warning(f"Audio download {url} failed ({e}), resuming ({attempt}/{ATTEMPTS})")
+                time.sleep(attempt)
+
+        digest = hashlib.sha256()
+        with open(part_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+        ext = os.path.splitext(urlparse(url).path)[1] or ".mp3"
+        relpath = f"{sha256[:2]}/{sha256}{ext}"
+        final_path = os.path.join(self.root, relpath)
+        size = os.path.getsize(part_path)
+        if os.path.exists(final_path):
+            os.remove(part_path)  # same clip already stored for another exam
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(part_path, final_path)
+        return {"sha256": sha256, "path": relpath, "bytes": size}
+
+    async def download(self, url: str) -> Dict:
+        """Download (or reuse) the file for url; concurrent callers share one fetch"""
+        if url in self._inflight:
+            return await asyncio.shield(self._inflight[url])
+        known = self._known(url)
+        if known:
+            return known
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[url] = future
+        try:
+            async with self._semaphore:
+                info = await asyncio.to_thread(self._download, url)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO audio_files VALUES (?, ?, ?, ?, ?)",
+                (url, info["sha256"], info["path"], info["bytes"], time.strftime("%Y-%m-%dT%H:%M:%S")))
+            self.conn.commit()
+            future.set_result(info)
+            return info
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # retrieved, so an unawaited failure is not logged twice
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            del self._inflight[url]
+
+    def close(self):
+        self.session.close()
+        self.conn.close()
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Offline benchmark - runs main.py end to end against the local fixture server
+Reports exams/sec, per-phase latency and peak RSS per engine and concurrency,
+and compares them with stored baselines
+"""
+
+import argparse
+import itertools
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+from server import FixtureServer
+
+try:
+    import psutil
+except ImportError:
+    psutil = None  # peak RSS falls back to getrusage (largest single process)
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+MAIN = os.path.join(os.path.dirname(BENCH_DIR), "main.py")
+BASELINES_FILE = os.path.join(BENCH_DIR, "baselines.json")
+
+REPORTED_PHASES = ("goto", "wait", "extract", "submit", "answers", "save", "exam")
+
+
+class RssSampler:
+    """Samples the summed RSS of a process tree (main.py plus Chromium)"""
+
+    def __init__(self, pid: int, interval: float = 0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        try:
+            root = psutil.Process(self.pid)
+        except psutil.Error:
+            return
+        while not self._stop.is_set():
+            try:
+                procs = [root] + root.children(recursive=True)
+                total = 0
+                for proc in procs:
+                    try:
+                        total += proc.memory_info().rss
+                    except psutil.Error:
+                        pass
+                self.peak = max(self.peak, total)
+            except psutil.Error:
+                return
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> int:
+        self._stop.set()
+        self._thread.join()
+        return self.peak
+
+
+def run_scenario(server: FixtureServer, exam_type: str, engine: str, concurrency: int,
+                 count: int, rate: float) -> Dict:
+    """Scrape IDs 1..count of one type with main.py and collect its numbers"""
+    with tempfile.TemporaryDirectory(prefix="vstep-bench-") as workdir:
+        metrics_path = os.path.join(workdir, "metrics.json")
+        env = dict(os.environ,
+                   VSTEP_BASE_URL=server.url,
+                   VSTEP_USERNAME="bench",
+                   VSTEP_PASSWORD="bench",
+                   OUTPUT_DIR=os.path.join(workdir, "data"),
+                   VSTEP_SESSION_FILE=os.path.join(workdir, "session.json"))
+        cmd = [sys.executable, MAIN, "--type", exam_type, "--start", "1", "--end", str(count),
+               "--engine", engine, "--concurrency", str(concurrency),
+               "--rate", str(rate), "--max-rate", str(rate),
+               "--manifest", os.path.join(workdir, "manifest.sqlite"),
+               "--metrics-json", metrics_path]
+
+        server.hits.clear()
+        started = time.monotonic()
+        proc = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        sampler = RssSampler(proc.pid) if psutil else None
+        if sampler:
+            sampler.start()
+        output, _ = proc.communicate()
+        wall = time.monotonic() - started
+        peak_rss = sampler.stop() if sampler else resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+
+        if proc.returncode != 0 or not os.path.exists(metrics_path):
+            tail = output.decode("utf-8", "replace").strip().splitlines()[-5:]
+            raise RuntimeError(f"main.py failed ({proc.returncode}): " + " | ".join(tail))
+        with open(metrics_path, 'r', encoding='utf-8') as f:
+            metrics = json.load(f)
+
+    type_metrics = metrics["exam_types"].get(exam_type, {})
+    exams = sum(type_metrics.get("outcomes", {}).values())
+    return {
+        "exams": exams,
+        "outcomes": type_metrics.get("outcomes", {}),
+        "wall_seconds": round(wall, 2),
+        "exams_per_sec": round(type_metrics.get("exams_per_minute", 0) / 60, 3),
+        "peak_rss_mb": round(peak_rss / 2 ** 20, 1),
+        "requests": dict(server.hits),
+        "phases": {p: {k: v for k, v in h.items() if k in ("p50", "p95", "p99")}
+                   for p, h in type_metrics.get("phases", {}).items() if p in REPORTED_PHASES},
+    }
+
+
+def scenario_key(exam_type: str, engine: str, concurrency: int) -> str:
+    return f"{exam_type}/{engine}/c{concurrency}"
+
+
+def load_baselines(path: str) -> Dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(result: Dict, baseline: Optional[Dict]) -> str:
+    if not baseline or not baseline.get("exams_per_sec"):
+        return "no baseline"
+    change = result["exams_per_sec"] / baseline["exams_per_sec"] - 1
+    return f"{change:+.1%} vs baseline"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark main.py against local fixtures")
+    parser.add_argument("--types", default="listening,reading,writing,speaking")
+    parser.add_argument("--engines", default="browser,http")
+    parser.add_argument("--concurrency", default="1,4", help="Comma-separated concurrency levels")
+    parser.add_argument("--count", type=int, default=40, help="Exam IDs per scenario")
+    parser.add_argument("--latency", type=float, default=0.05, help="Server latency per page (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--vip-every", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=1000.0,
+                        help="Fixed scraper rate limit, high so the site latency is what gets measured")
+    parser.add_argument("--baselines", default=BASELINES_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--fail-threshold", type=float, default=None,
+                        help="Exit 1 when exams/sec drops more than this fraction below baseline (e.g. 0.1)")
+    parser.add_argument("--output", help="Also write the full results as JSON here")
+    args = parser.parse_args()
+
+    types = [t for t in args.types.split(",") if t]
+    engines = [e for e in args.engines.split(",") if e]
+    levels = [int(c) for c in args.concurrency.split(",") if c]
+
+    baselines = load_baselines(args.baselines)
+    results: Dict[str, Dict] = {}
+    regressions: List[str] = []
+
+    server = FixtureServer(args.latency, args.jitter, max_id=args.count, vip_every=args.vip_every).start()
+    try:
+        for exam_type, engine, concurrency in itertools.product(types, engines, levels):
+            key = scenario_key(exam_type, engine, concurrency)
+            try:
+                result = run_scenario(server, exam_type, engine, concurrency, args.count, args.rate)
+            except RuntimeError as e:
+                print(f"{key:28} FAILED {e}")
+                continue
+            results[key] = result
+            baseline = baselines.get(key)
+            phases = " ".join(f"{p}={v['p50']:.3f}/{v['p95']:.3f}s" for p, v in result["phases"].items())
+            print(f"{key:28} {result['exams_per_sec']:7.2f} exams/s  wall {result['wall_seconds']:6.1f}s  "
+                  f"rss {result['peak_rss_mb']:7.1f} MB  ({compare(result, baseline)})")
+            print(f"{'':28} p50/p95 {phases}")
+            if (args.fail_threshold is not None and baseline and baseline.get("exams_per_sec")
+                    and result["exams_per_sec"] < baseline["exams_per_sec"] * (1 - args.fail_threshold)):
+                regressions.append(key)
+    finally:
+        server.stop()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        baselines.update(results)
+        with open(args.baselines, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"Saved {len(results)} baselines to {args.baselines}")
+    if regressions:
+        print(f"Throughput regressions: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Local fixture server mimicking the luyenthivstep.vn routes used by main.py
+Serves the HTML in bench/fixtures with configurable latency
+"""
+
+import argparse
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+EXAM_PAGES = {"nghe": "listening", "doc": "reading", "viet": "writing", "noi": "speaking"}
+SESSION_COOKIE = "vstep_bench_session=1"
+
+STATIC_TYPES = {
+    ".css": "text/css", ".js": "application/javascript", ".png": "image/png",
+    ".woff2": "font/woff2", ".mp3": "audio/mpeg",
+}
+# Big enough that downloading it is noticeable, like a real audio clip
+STATIC_SIZES = {".mp3": 512 * 1024, ".png": 64 * 1024, ".woff2": 32 * 1024}
+
+
+def load_fixtures() -> dict:
+    fixtures = {}
+    for name in os.listdir(FIXTURES_DIR):
+        if name.endswith(".html"):
+            with open(os.path.join(FIXTURES_DIR, name), 'r', encoding='utf-8') as f:
+                fixtures[name[:-5]] = f.read()
+    return fixtures
+
+
+class FixtureServer:
+    """Threaded HTTP server in the background, one per benchmark run"""
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.02, max_id: int = 1000,
+                 vip_every: int = 10, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.max_id = max_id
+        self.vip_every = vip_every
+        self.fixtures = load_fixtures()
+        self.hits = Counter()
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FixtureServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def count(self, route: str):
+        with self._lock:
+            self.hits[route] += 1
+
+    def page(self, name: str, exam_id: int = 0) -> bytes:
+        return self.fixtures[name].replace("{{exam_id}}", str(exam_id)).encode("utf-8")
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _delay(self):
+                if server.latency or server.jitter:
+                    time.sleep(server.latency + random.uniform(0, server.jitter))
+
+            def _logged_in(self) -> bool:
+                return SESSION_COOKIE in self.headers.get("Cookie", "")
+
+            def _send(self, status: int, body: bytes = b"", content_type: str = "text/html; charset=utf-8",
+                      headers: Optional[dict] = None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+            def _redirect(self, location: str, cookie: Optional[str] = None):
+                headers = {"Location": location}
+                if cookie:
+                    headers["Set-Cookie"] = f"{cookie}; Path=/; HttpOnly"
+                self._send(302, headers=headers)
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path.startswith("/static/"):
+                    server.count("static")
+                    ext = os.path.splitext(path)[1]
+                    body = b"\0" * STATIC_SIZES.get(ext, 1024)
+                    content_type = STATIC_TYPES.get(ext, "application/octet-stream")
+                    match = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range", ""))
+                    if match:
+                        start = int(match.group(1))
+                        if start >= len(body):
+                            self._send(416, headers={"Content-Range": f"bytes */{len(body)}"})
+                        else:
+                            self._send(206, body[start:], content_type,
+                                       {"Content-Range": f"bytes {start}-{len(body) - 1}/{len(body)}"})
+                        return
+                    self._send(200, body, content_type, {"Accept-Ranges": "bytes"})
+                    return
+
+                self._delay()
+                if path == "/dang-nhap":
+                    server.count("login")
+                    self._send(200, server.page("login"))
+                    return
+                if not self._logged_in():
+                    server.count("redirect")
+                    self._redirect("/dang-nhap")
+                    return
+                if path in ("/", "/tai-khoan"):
+                    server.count("account")
+                    self._send(200, server.page("account"))
+                    return
+
+                match = re.fullmatch(r"/luyen-de/lam-bai-(nghe|doc|viet|noi)/(\d+)", path)
+                if match:
+                    exam_id = int(match.group(2))
+                    if exam_id < 1 or exam_id > server.max_id:
+                        server.count("missing")
+                        self._send(404, b"<html><head><title>404</title></head><body>Not found</body></html>")
+                    elif server.vip_every and exam_id % server.vip_every == 0:
+                        server.count("vip")
+                        self._send(200, server.page("vip", exam_id))
+                    else:
+                        server.count(EXAM_PAGES[match.group(1)])
+                        self._send(200, server.page(EXAM_PAGES[match.group(1)], exam_id))
+                    return
+
+                match = re.fullmatch(r"/luyen-de/ket-qua/(\d+)", path)
+                if match:
+                    server.count("ket-qua")
+                    self._send(200, server.page("ket-qua", int(match.group(1))))
+                    return
+
+                server.count("not-found")
+                self._send(404, b"Not found", "text/plain")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                self.rfile.read(length)
+                path = self.path.split("?")[0]
+                self._delay()
+                if path == "/dang-nhap":
+                    server.count("login")
+                    self._redirect("/", SESSION_COOKIE)
+                    return
+                if not self._logged_in():
+                    self._redirect("/dang-nhap")
+                    return
+                match = re.fullmatch(r"/luyen-de/nop-bai-(nghe|doc)/(\d+)", path)
+                if match:
+                    server.count("submit")
+                    self._redirect(f"/luyen-de/ket-qua/{match.group(2)}")
+                    return
+                self._send(404, b"Not found", "text/plain")
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve VSTEP fixtures locally")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds added to every page")
+    parser.add_argument("--jitter", type=float, default=0.02, help="Random extra latency (seconds)")
+    parser.add_argument("--max-id", type=int, default=1000, help="Highest exam ID that exists")
+    parser.add_argument("--vip-every", type=int, default=10, help="Every Nth exam ID is VIP-locked (0: none)")
+    args = parser.parse_args()
+
+    server = FixtureServer(args.latency, args.jitter, args.max_id, args.vip_every, port=args.port)
+    print(f"Serving fixtures on {server.url} (VSTEP_BASE_URL={server.url})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Duplicate detection at write time - a normalized fingerprint per exam is
+checked against a persistent index before the exam is saved
+  exact   same content after normalizing case, whitespace and Unicode
+  near    MinHash signatures bucketed with LSH, so exams differing only in
+          whitespace or ordering match without comparing every pair
+Duplicates are recorded as aliases of the first (canonical) exam ID
+"""
+
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import time
+import unicodedata
+from array import array
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set
+from urllib.parse import urlparse
+
+# The part of a record that is the exam itself (title, URLs and IDs are not)
+CONTENT_FIELDS = {
+    "listening": ("audio_url", "questions"),
+    "reading": ("passages",),
+    "writing": ("tasks",),
+    "speaking": ("parts",),
+}
+
+# Fields that must be equal for a near duplicate too: listening exams share
+# option sets, the recording is what tells them apart
+IDENTITY_FIELDS = {
+    "listening": ("audio_url",),
+}
+
+# MinHash: NUM_PERM hashes split into BANDS bands of ROWS for LSH.
+# Pairs above ~0.5 Jaccard share a bucket with high probability.
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 3
+DEFAULT_THRESHOLD = 0.9
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(0x5EED)  # fixed, signatures must be comparable across runs
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip().lower()
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return normalize_text(value)
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def _audio_identity(url: Optional[str]) -> Optional[str]:
+    """The file path of an audio URL; host and query (signatures, cache busters) vary"""
+    return urlparse(url).path if url else None
+
+
+def exam_content(exam_type: str, data: Dict) -> Dict:
+    """Normalized content fields of a record"""
+    fields = CONTENT_FIELDS.get(exam_type)
+    if fields is None:
+        fields = [k for k in data if k not in ("exam_type", "exam_id", "title", "source_url", "scraped_at")]
+    return {f: _audio_identity(data.get(f)) if f == "audio_url" else _normalize(data.get(f)) for f in fields}
+
+
+def exam_identity(exam_type: str, data: Dict) -> str:
+    """Identity fields as one string, "" for types without any"""
+    fields = IDENTITY_FIELDS.get(exam_type)
+    if not fields:
+        return ""
+    content = exam_content(exam_type, data)
+    return json.dumps([content.get(f) for f in fields], ensure_ascii=False)
+
+
+def exam_fingerprint(exam_type: str, data: Dict) -> str:
+    """Hash of the normalized content; equal for exact duplicates"""
+    payload = json.dumps(exam_content(exam_type, data), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _strings(value) -> Iterator[str]:
+    if isinstance(value, str):
+        if value:
+            yield value
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from _strings(v)
+    elif isinstance(value, list):
+        for v in value:
+            yield from _strings(v)
+
+
+def shingles(exam_type: str, data: Dict) -> Set[int]:
+    """Word n-grams of every text field as 64-bit hashes; a set, so order does not matter"""
+    result = set()
+    identity = IDENTITY_FIELDS.get(exam_type, ())
+    content = {k: v for k, v in exam_content(exam_type, data).items() if k not in identity}
+    for text in _strings(content):
+        words = text.split(" ")
+        grams = [" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))]
+        for gram in grams:
+            digest = hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest()
+            result.add(int.from_bytes(digest, "little") % _PRIME)
+    return result
+
+
+def minhash(values: Set[int]) -> List[int]:
+    if not values:
+        return [_PRIME] * NUM_PERM
+    return [min((a * x + b) % _PRIME for x in values) for a, b in _PERMUTATIONS]
+
+
+def similarity(sig_a: List[int], sig_b: List[int]) -> float:
+    """Estimated Jaccard similarity of two MinHash signatures"""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def band_keys(signature: List[int], identity: str = "") -> List[str]:
+    """LSH bucket per band; the identity is mixed in so only exams sharing it collide"""
+    salt = identity.encode("utf-8")
+    return [hashlib.blake2b(salt + array("Q", signature[b * ROWS:(b + 1) * ROWS]).tobytes(),
+                            digest_size=8).hexdigest() for b in range(BANDS)]
+
+
+class Duplicate(NamedTuple):
+    canonical_id: int
+    kind: str  # "exact" or "near"
+    similarity: float
+
+
+class DedupIndex:
+    """Persistent fingerprint index (canonical exams) plus their aliases.
+
+    check() registers a new exam and returns None, or returns the canonical
+    exam it duplicates. The index lives in the manifest database.
+    """
+
+    def __init__(self, path: str, near: bool = False, threshold: float = DEFAULT_THRESHOLD):
+        self.near = near
+        self.threshold = threshold
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # check() runs in a worker thread of the crawl pipeline, one call at a time
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS dedup_exams (
+                exam_type TEXT NOT NULL,
+                exam_id INTEGER NOT NULL,
+                fingerprint TEXT NOT NULL,
+                signature BLOB,
+                PRIMARY KEY (exam_type, exam_id)
+            );
+            CREATE INDEX IF NOT EXISTS dedup_exams_fingerprint ON dedup_exams (exam_type, fingerprint);
+            CREATE TABLE IF NOT EXISTS dedup_bands (
+                exam_type TEXT NOT NULL,
+                band INTEGER NOT NULL,
+                bucket TEXT NOT NULL,
+                exam_id INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS dedup_bands_bucket ON dedup_bands (exam_type, band, bucket);
+            CREATE INDEX IF NOT EXISTS dedup_bands_exam ON dedup_bands (exam_type, exam_id);
+            CREATE TABLE IF NOT EXISTS dedup_aliases (
+                exam_type TEXT NOT NULL,
+                exam_id INTEGER NOT NULL,
+                canonical_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                similarity REAL NOT NULL,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (exam_type, exam_id)
+            );
+        """)
+        self.conn.commit()
+
+    def _exact(self, exam_type: str, exam_id: int, fingerprint: str) -> Optional[int]:
+        row = self.conn.execute(
+            "SELECT MIN(exam_id) FROM dedup_exams WHERE exam_type = ? AND fingerprint = ? AND exam_id != ?",
+            (exam_type, fingerprint, exam_id)).fetchone()
+        return row[0]
+
+    def _nearest(self, exam_type: str, exam_id: int, signature: List[int], keys: List[str]) -> Optional[Duplicate]:
+        candidates: Set[int] = set()
+        for band, key in enumerate(keys):
+            rows = self.conn.execute(
+                "SELECT exam_id FROM dedup_bands WHERE exam_type = ? AND band = ? AND bucket = ?",
+                (exam_type, band, key))
+            candidates.update(r[0] for r in rows)
+        candidates.discard(exam_id)
+        best: Optional[Duplicate] = None
+        for candidate in sorted(candidates):
+            row = self.conn.execute(
+                "SELECT signature FROM dedup_exams WHERE exam_type = ? AND exam_id = ?",
+                (exam_type, candidate)).fetchone()
+            if not row or not row[0]:
+                continue
+            score = similarity(signature, list(array("Q", row[0])))
+            if score >= self.threshold and (best is None or score > best.similarity):
+                best = Duplicate(candidate, "near", score)
+        return best
+
+    def check(self, exam_type: str, exam_id: int, data: Dict) -> Optional[Duplicate]:
+        """Return the canonical exam this one duplicates, or register it as new"""
+        fingerprint = exam_fingerprint(exam_type, data)
+        duplicate = None
+        canonical = self._exact(exam_type, exam_id, fingerprint)
+        if canonical is not None:
+            duplicate = Duplicate(canonical, "exact", 1.0)
+
+        signature = keys = None
+        if self.near and duplicate is None:
+            signature = minhash(shingles(exam_type, data))
+            keys = band_keys(signature, exam_identity(exam_type, data))
+            duplicate = self._nearest(exam_type, exam_id, signature, keys)
+
+        # A canonical exam that now duplicates another gets re-pointed too
+        self.conn.execute("DELETE FROM dedup_exams WHERE exam_type = ? AND exam_id = ?", (exam_type, exam_id))
+        self.conn.execute("DELETE FROM dedup_bands WHERE exam_type = ? AND exam_id = ?", (exam_type, exam_id))
+        if duplicate:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO dedup_aliases VALUES (?, ?, ?, ?, ?, ?)",
+                (exam_type, exam_id, duplicate.canonical_id, duplicate.kind, duplicate.similarity,
+                 time.strftime("%Y-%m-%dT%H:%M:%S")))
+        else:
+            self.conn.execute(
+                "DELETE FROM dedup_aliases WHERE exam_type = ? AND exam_id = ?", (exam_type, exam_id))
+            self.conn.execute(
+                "INSERT INTO dedup_exams VALUES (?, ?, ?, ?)",
+                (exam_type, exam_id, fingerprint, array("Q", signature).tobytes() if signature else None))
+            if keys:
+                self.conn.executemany(
+                    "INSERT INTO dedup_bands VALUES (?, ?, ?, ?)",
+                    [(exam_type, band, key, exam_id) for band, key in enumerate(keys)])
+        self.conn.commit()
+        return duplicate
+
+    def aliases(self, exam_type: str) -> Dict[int, int]:
+        """Duplicate exam ID -> canonical exam ID"""
+        rows = self.conn.execute(
+            "SELECT exam_id, canonical_id FROM dedup_aliases WHERE exam_type = ?", (exam_type,))
+        return dict(rows.fetchall())
+
+    def close(self):
+        self.conn.close()
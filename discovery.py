@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Exam ID discovery - find which IDs exist before scraping them
+Gallops to the live upper bound, binary-searches it, then probes the gaps below
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# probe(exam_id) -> True when an exam exists at that ID
+Probe = Callable[[int], Awaitable[bool]]
+
+# Consecutive missing IDs tolerated before the range is considered over
+DEFAULT_GAP = 8
+# First gallop step above the start ID; doubled until a dead region is hit
+DEFAULT_STEP = 64
+# Never probe past this ID, whatever the gallop finds
+DEFAULT_LIMIT = 1_000_000
+
+
+class Discovery:
+    """Memoized prober for one exam type; once stop() returns True, unprobed
+    IDs count as missing (and are not remembered)"""
+
+    def __init__(self, probe: Probe, known: Iterable[int] = (), gap: int = DEFAULT_GAP,
+                 concurrency: int = 4, limit: int = DEFAULT_LIMIT, stop: Optional[Callable[[], bool]] = None):
+        self.probe = probe
+        self.stop = stop
+        self.gap = max(1, gap)
+        self.limit = limit
+        self.results: Dict[int, bool] = {exam_id: True for exam_id in known}
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.probes = 0
+
+    @property
+    def stopped(self) -> bool:
+        return bool(self.stop and self.stop())
+
+    async def exists(self, exam_id: int) -> bool:
+        if exam_id not in self.results:
+            async with self.semaphore:
+                if exam_id in self.results:
+                    return self.results[exam_id]
+                if self.stopped:
+                    return False
+                self.probes += 1
+                self.results[exam_id] = await self.probe(exam_id)
+        return self.results[exam_id]
+
+    async def live_near(self, exam_id: int) -> bool:
+        """True when any of the `gap` IDs starting at exam_id exists"""
+        window = range(exam_id, min(exam_id + self.gap, self.limit + 1))
+        found = await asyncio.gather(*(self.exists(i) for i in window))
+        return any(found)
+
+    async def upper_bound(self, start: int, step: int = DEFAULT_STEP) -> Optional[int]:
+        """Highest existing ID reachable from start without a gap wider than `gap`"""
+        lo = start
+        hi = min(start + step, self.limit)
+        while hi > lo and await self.live_near(hi):
+            lo = hi
+            step *= 2
+            hi = min(lo + step, self.limit)
+        # live_near(lo) holds (or lo is the start), live_near(hi) does not
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if await self.live_near(mid):
+                lo = mid
+            else:
+                hi = mid
+        await self.live_near(lo)
+        # Known IDs past a wide gap still extend the range
+        live = [i for i, ok in self.results.items() if ok and i >= start]
+        return max(live) if live else None
+
+    async def live_ids(self, start: int, end: int) -> List[int]:
+        """Probe every ID in [start, end] that is not known yet"""
+        ids = list(range(start, end + 1))
+        found = await asyncio.gather(*(self.exists(i) for i in ids))
+        return [i for i, ok in zip(ids, found) if ok]
+
+
+async def discover_ids(probe: Probe, start: int = 1, known: Iterable[int] = (),
+                       gap: int = DEFAULT_GAP, concurrency: int = 4,
+                       limit: int = DEFAULT_LIMIT, stop: Optional[Callable[[], bool]] = None) -> List[int]:
+    """Existing exam IDs from start up to the live upper bound.
+
+    `known` holds IDs already known to exist (for example from the crawl
+    manifest); they are never probed again. Probing ends early once stop()
+    returns True, leaving the rest for a later run.
+    """
+    discovery = Discovery(probe, known, gap, concurrency, limit, stop)
+    upper = await discovery.upper_bound(start)
+    if upper is None:
+        logger.info(f"No exams found from #{start} ({discovery.probes} probes)")
+        return []
+    ids = await discovery.live_ids(start, upper)
+    if discovery.stopped:
+        logger.info(f"Discovery stopped early after {discovery.probes} probes")
+    logger.info(f"Found {len(ids)} exams in #{start}..#{upper} ({discovery.probes} probes)")
+    return ids
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""
+Pooled requests session sharing the browser's login - the base of the HTTP
+page engine and the audio downloader
+"""
+
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class CookieSession:
+    """requests.Session with a connection pool of pool_size, logged in by
+    copying the browser context cookies"""
+
+    def __init__(self, pool_size: int = 1, user_agent: Optional[str] = None):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if user_agent:
+            self.session.headers["User-Agent"] = user_agent
+
+    def set_cookies(self, cookies: List[Dict]):
+        """Replace session cookies with the browser context cookies"""
+        self.session.cookies.clear()
+        for c in cookies:
+            self.session.cookies.set(c["name"], c["value"], domain=c["domain"], path=c["path"])
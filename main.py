@@ -8,10 +8,39 @@ import json
 import os
 import re
 import time
+import asyncio
 import logging
 import argparse
-from typing import Dict, List, Optional
-from playwright.sync_api import sync_playwright, Page, Browser
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+from urllib.parse import parse_qsl
+
+import requests
+from bs4 import BeautifulSoup
+from playwright.async_api import async_playwright, Page, Browser, BrowserContext, Route
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from manifest import (CrawlManifest, NegativeCache, content_hash, parse_duration, parse_ttls, STATUS_OK, STATUS_VIP, STATUS_INVALID,
+                      STATUS_EMPTY, STATUS_ERROR, STATUS_DUPLICATE)
+from archive import KIND_EXAM, KIND_RESULT, ArchiveEntry, PageArchive, read_page
+from audio import AudioDownloader
+from httpsession import CookieSession
+from pipeline import DEFAULT_QUEUE_SIZE, Pipeline, Stage
+from refresh import DEFAULT_MIN_AGE, DISCOVERY_SHARE, RefreshBudget, highest_known, refresh_order
+from recycle import BROWSER, CONTEXT, PAGE, RecyclePolicy, format_memory
+from scheduler import DEFAULT_WEIGHTS, ExamStream, WeightedScheduler, parse_weights
+from workqueue import DEFAULT_LEASE_SECONDS, LeaseQueue, parse_shard
+from dedup import DEFAULT_THRESHOLD, DedupIndex, exam_fingerprint
+from discovery import DEFAULT_GAP, discover_ids
+from ratelimit import (AdaptiveRateLimiter, Throttled, is_throttle_status,
+                       DEFAULT_RATE, DEFAULT_MIN_RATE, DEFAULT_MAX_RATE)
+from metrics import Metrics
+from parsers import (answers_from, parse_answers, parse_listening, parse_reading, parse_speaking, parse_writing,
+                     submit_fields)
+from schemas import ANSWER_FIRST_OPTIONS, ANSWERS, EXAM_SCHEMAS, compile_script
+from search import IndexWriter
+from sinks import FORMATS, BatchWriter, FileSink, open_sink
 
 # Load environment variables from .env file
 try:
@@ -32,49 +61,563 @@ BASE_URL = os.getenv("VSTEP_BASE_URL", "https://luyenthivstep.vn")
 USERNAME = os.getenv("VSTEP_USERNAME", "")
 PASSWORD = os.getenv("VSTEP_PASSWORD", "")
 OUTPUT_DIR = os.getenv("OUTPUT_DIR", "data")
+DISCOVERED_IDS_FILE = os.path.join(OUTPUT_DIR, "discovered_ids.json")
+SESSION_FILE = os.getenv("VSTEP_SESSION_FILE", ".vstep_session.json")
+# Page that only logged-in users can open; used to check a saved session
+SESSION_CHECK_PATH = "/tai-khoan"
+# Resource types dropped by the request filter (extractors only read the DOM)
+BLOCKED_RESOURCES = [r for r in os.getenv("VSTEP_BLOCK_RESOURCES", "image,media,font").split(",") if r]
+BLOCKED_URL_PATTERNS = [
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net",
+    "facebook.net", "connect.facebook.com", "hotjar.com",
+]
+READY_TIMEOUT_MS = 10000
+PROBE_ATTEMPTS = 3
+
+VIP_MARKERS = ["Đây là mã đề VIP", "cần nâng cấp tài khoản"]
+
+EXAM_TYPES = ["listening", "reading", "writing", "speaking"]
+EXAM_PATHS = {
+    "listening": "lam-bai-nghe",
+    "reading": "lam-bai-doc",
+    "writing": "lam-bai-viet",
+    "speaking": "lam-bai-noi",
+}
+# Element each extractor reads; its presence means the exam exists
+READY_SELECTORS = {
+    "listening": ".question-block",
+    "reading": ".question-block",
+    "writing": ".card-body",
+    "speaking": ".card-body",
+}
+
+# HTTP statuses of IDs that do not exist (any more); dead like an empty exam page
+GONE_STATUSES = (404, 410)
+
+# Grace after the load event for content rendered by scripts, before a page
+# without the selector (empty exam, 404, deleted ID) is taken as final
+READY_SETTLE_MS = 500
+
+# Resolves once the extractor's selector exists, the page is one we skip anyway,
+# or the page finished loading READY_SETTLE_MS ago without the selector
+READY_SCRIPT = """
+    ([selector, markers, settle]) => {
+        if (document.querySelector(selector)) return true;
+        const path = location.pathname;
+        if (path.startsWith('/dang-nhap') || path.startsWith('/tai-khoan')) return true;
+        const text = document.body ? document.body.innerText : '';
+        if (markers.some(m => text.includes(m))) return true;
+        if (document.readyState !== 'complete') return false;
+        window.__readySince = window.__readySince || performance.now();
+        return performance.now() - window.__readySince >= settle;
+    }
+"""
 
 # Validate required config
 if not USERNAME or not PASSWORD:
     logger.warning("VSTEP_USERNAME and VSTEP_PASSWORD not set. Please create a .env file or set environment variables.")
 
 
+class SessionExpired(Exception):
+    """Raised when a page redirects to the login form in the middle of a run"""
+
+
+class Fetched(NamedTuple):
+    """An exam on its way through the crawl pipeline"""
+    exam_type: str
+    exam_id: int
+    status: str
+    data: Optional[Dict]  # the record to save, once extracted
+    started: float
+    html: Optional[str] = None  # HTTP engine: page left for the parse stage
+
+
+def build_exam_url(exam_type: str, exam_id: int) -> str:
+    return f"{BASE_URL}/luyen-de/{EXAM_PATHS[exam_type]}/{exam_id}"
+
+
+def page_status(url: str, content: str) -> str:
+    """Classify a loaded page: STATUS_OK for a valid exam page (shared by both engines)"""
+    # Session lost: let the caller login again instead of skipping
+    if "/dang-nhap" in url:
+        raise SessionExpired(url)
+    
+    # Check for wrong redirects
+    if "/tai-khoan" in url:
+        return STATUS_INVALID
+    
+    # Check for VIP content
+    if any(marker in content for marker in VIP_MARKERS):
+        return STATUS_VIP
+    
+    return STATUS_OK
+
+
+def is_empty(exam_type: str, exam_data: Dict) -> bool:
+    """True when a valid page yielded nothing to save"""
+    if exam_type == "reading":
+        return sum(len(p['questions']) for p in exam_data['passages']) == 0
+    return len(exam_data[{"listening": "questions", "writing": "tasks", "speaking": "parts"}[exam_type]]) == 0
+
+
+def exam_record(exam_type: str, exam_id: int, url: str, exam_data: Dict,
+                answers: Optional[Dict] = None, scraped_at: Optional[str] = None) -> Dict:
+    """Build the saved record from extracted page data (live scraping and --replay)"""
+    answers = answers or {}
+    record = {
+        "exam_type": exam_type,
+        "exam_id": str(exam_id),
+        "title": exam_data['title'],
+        "source_url": url,
+        "scraped_at": scraped_at or time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    if exam_type == "listening":
+        record["audio_url"] = exam_data['audio_url']
+        record["questions"] = [{
+            "question_number": q['number'],
+            "options": q['options'],
+            "correct_answer": answers.get(q['number']) or answers.get(str(q['number']))
+        } for q in exam_data['questions']]
+    elif exam_type == "reading":
+        q_counter = 0
+        formatted_passages = []
+        for p in exam_data['passages']:
+            formatted_questions = []
+            for q in p['questions']:
+                q_counter += 1
+                formatted_questions.append({
+                    "question_number": q_counter,
+                    "options": q['options'],
+                    "correct_answer": answers.get(q_counter) or answers.get(str(q_counter))
+                })
+            formatted_passages.append({
+                "passage_number": p['number'],
+                "content": p['content'],
+                "questions": formatted_questions
+            })
+        record["passages"] = formatted_passages
+    elif exam_type == "writing":
+        record["tasks"] = exam_data['tasks']
+    else:
+        record["parts"] = exam_data['parts']
+    return record
+
+
+class HttpEngine(CookieSession):
+    """Browserless page fetcher over a pooled requests.Session.
+    
+    Only used for writing and speaking, whose pages need no JavaScript;
+    listening and reading still go through the browser to submit answers.
+    """
+    
+    def get(self, url: str) -> requests.Response:
+        """GET url, following redirects"""
+        return self.session.get(url, timeout=READY_TIMEOUT_MS / 1000)
+
+
+class SubmitTemplate:
+    """Answer form submission captured once from the UI, replayed for later exams"""
+    
+    def __init__(self, url: str, exam_id: int, post_data: str, page_html: str):
+        self.url = re.sub(rf"(?<=/){exam_id}(?=[/?#]|$)", "{exam_id}", url)
+        captured = dict(parse_qsl(post_data or "", keep_blank_values=True))
+        page_fields = submit_fields(page_html)
+        # Fields the page itself does not carry (timers, flags) are replayed as captured
+        self.static_fields = {k: v for k, v in captured.items() if k not in page_fields}
+    
+    def url_for(self, exam_id: int) -> str:
+        return self.url.replace("{exam_id}", str(exam_id))
+    
+    @staticmethod
+    def result_for(url: str, exam_id: int) -> bool:
+        """Whether a ket-qua URL carries the submitted exam's ID"""
+        return re.search(rf"(?<![0-9]){exam_id}(?![0-9])", url) is not None
+    
+    def payload(self, page_html: str) -> Dict[str, str]:
+        return {**self.static_fields, **submit_fields(page_html)}
+
+
 class VstepScraper:
     """Main scraper class using Playwright"""
     
-    def __init__(self, headless: bool = True):
+    def __init__(self, headless: bool = True, concurrency: int = 1,
+                 session_file: Optional[str] = SESSION_FILE,
+                 blocked_resources: Optional[List[str]] = None,
+                 engine: str = "browser", replay_submit: bool = True,
+                 manifest: Optional[CrawlManifest] = None, resume: Optional[str] = None,
+                 negative_cache: Optional[NegativeCache] = None, recheck: bool = False,
+                 limiter: Optional[AdaptiveRateLimiter] = None, metrics: Optional[Metrics] = None,
+                 sink: Optional[BatchWriter] = None, dedup: Optional[DedupIndex] = None,
+                 audio: Optional[AudioDownloader] = None, shard: Optional[Tuple[int, int]] = None,
+                 work_queue: Optional[LeaseQueue] = None, archive: Optional[PageArchive] = None,
+                 recycle: Optional[RecyclePolicy] = None, pipeline_queue: int = DEFAULT_QUEUE_SIZE,
+                 search_index: Optional[IndexWriter] = None):
         self.headless = headless
+        self.search_index = search_index
+        self.recycle = recycle if recycle and recycle.enabled else None
+        self._pool_cond = asyncio.Condition()
+        self._pool_due: Optional[str] = None
+        self._pool_generation = 0
+        self._active_workers = 0
+        self._parked_workers = 0
+        self.archive = archive
+        self.shard = shard
+        self.work_queue = work_queue
+        self.audio = audio
+        self.dedup = dedup
+        self.sink = sink or BatchWriter(FileSink(OUTPUT_DIR))
+        self.limiter = limiter or AdaptiveRateLimiter(burst=max(1, concurrency))
+        self.metrics = metrics or Metrics()
+        self.metrics.gauge("rate_limit_rps", lambda: self.limiter.rate)
+        self.metrics.gauge("rate_limit_backoffs", lambda: self.limiter.backoffs)
+        if self.recycle:
+            for level in (PAGE, CONTEXT, BROWSER):
+                self.metrics.gauge(f"{level}_recycles", lambda level=level: self.recycle.recycles[level])
+            if self.recycle.rss_limit:
+                self.metrics.gauge("renderer_rss_bytes",
+                                   lambda: (self.recycle.memory or {}).get("renderer", 0))
+        self.negative_cache = negative_cache
+        self.recheck = recheck
+        self.manifest = manifest
+        self.resume = resume
+        self.replay_submit = replay_submit
+        # Listening and reading submit to different endpoints: one template each
+        self.submit_templates: Dict[str, SubmitTemplate] = {}
+        self.replay_disabled: Set[str] = set()
+        self.engine = engine
+        self.http: Optional[HttpEngine] = None
+        self.blocked_resources = set(BLOCKED_RESOURCES if blocked_resources is None else blocked_resources)
+        self.concurrency = max(1, concurrency)
+        self.session_file = session_file
+        self.session_restored = False
+        self.session_generation = 0
+        self._login_lock = asyncio.Lock()
         self.browser: Optional[Browser] = None
+        self.context: Optional[BrowserContext] = None
         self.page: Optional[Page] = None
+        self.pages: List[Page] = []
         self.playwright = None
+        self.pipeline_queue = pipeline_queue
+        self.saved: Dict[str, int] = {}
+        self.scrape_funcs = {
+            "listening": self.scrape_listening,
+            "reading": self.scrape_reading,
+            "writing": self.scrape_writing,
+            "speaking": self.scrape_speaking
+        }
         
-    def start(self):
-        """Start browser"""
-        self.playwright = sync_playwright().start()
-        self.browser = self.playwright.chromium.launch(headless=self.headless)
-        self.page = self.browser.new_page()
-        logger.info("Browser started")
+    async def start(self):
+        """Start browser and a pool of pages sharing one context (and session)"""
+        self.playwright = await async_playwright().start()
+        self.browser = await self.playwright.chromium.launch(headless=self.headless)
         
-    def stop(self):
-        """Stop browser"""
+        if self.session_file and os.path.exists(self.session_file):
+            try:
+                await self._open_context(self.session_file)
+                self.session_restored = True
+            except Exception as e:
+                logger.warning(f"Cannot load saved session {self.session_file}: {e}")
+        if not self.context:
+            await self._open_context()
+        logger.info(f"Browser started ({self.concurrency} pages)")
+    
+    async def _open_context(self, storage_state=None):
+        """New context (with the request filter) and page pool, from a session file or dict"""
+        self.context = await self.browser.new_context(storage_state=storage_state)
+        if self.blocked_resources or BLOCKED_URL_PATTERNS:
+            await self.context.route("**/*", self._filter_request)
+        self.pages = [await self.context.new_page() for _ in range(self.concurrency)]
+        self.page = self.pages[0]
+    
+    async def _recycle_page(self, slot: int):
+        """Replace one worker's page with a fresh one in the same context"""
+        old = self.pages[slot]
+        navigations = self.recycle.pages.get(id(old), 0)
+        self.pages[slot] = await self.context.new_page()
+        if old is self.page:
+            self.page = self.pages[slot]
+        await old.close()
+        self.recycle.recycled(PAGE, old)
+        logger.info(f"Recycled page {slot} after {navigations} navigations")
+    
+    async def _recycle_pool(self, level: str):
+        """Replace the context and its pages (and the browser for BROWSER), keeping the session"""
+        navigations = self.recycle.browser_count if level == BROWSER else self.recycle.context_count
+        before = self.recycle.read_memory()
+        started = time.monotonic()
+        state = await self.context.storage_state()
+        if level == BROWSER:
+            await self.browser.close()
+            self.browser = await self.playwright.chromium.launch(headless=self.headless)
+        else:
+            await self.context.close()
+        await self._open_context(state)
+        self.recycle.recycled(level)
+        after = self.recycle.read_memory()
+        logger.info(f"Recycled {level} after {navigations} navigations in {time.monotonic() - started:.1f}s "
+                    f"({format_memory(before)} -> {format_memory(after)})")
+    
+    async def _checkpoint(self, slot: int):
+        """Between two exams: recycle this worker's page when due, or wait
+        with the other workers until the whole pool has been recycled"""
+        if not self.recycle:
+            return
+        async with self._pool_cond:
+            if self._pool_due is None:
+                self._pool_due = self.recycle.pool_due()
+            if self._pool_due is None:
+                if self.recycle.page_due(self.pages[slot]):
+                    await self._recycle_page(slot)
+                return
+            generation = self._pool_generation
+            self._parked_workers += 1
+            if self._parked_workers == self._active_workers:
+                await self._finish_pool_recycle()
+            else:
+                await self._pool_cond.wait_for(lambda: self._pool_generation != generation)
+    
+    async def _finish_pool_recycle(self):
+        """Run the pending pool recycle once every active worker is parked (lock held)"""
+        try:
+            await self._recycle_pool(self._pool_due)
+        finally:
+            self._pool_due = None
+            self._parked_workers = 0
+            self._pool_generation += 1
+            self._pool_cond.notify_all()
+    
+    async def _worker_exit(self):
+        """A finished worker must not hold up a recycle the others are parked for"""
+        async with self._pool_cond:
+            self._active_workers -= 1
+            if self._pool_due and self._active_workers and self._parked_workers == self._active_workers:
+                await self._finish_pool_recycle()
+        
+    async def stop(self):
+        """Stop browser, keeping the (possibly refreshed) session for next run"""
+        if self.context and self.session_generation:
+            await self._save_session()
         if self.browser:
-            self.browser.close()
+            await self.browser.close()
         if self.playwright:
-            self.playwright.stop()
+            await self.playwright.stop()
         logger.info("Browser stopped")
         
-    def login(self) -> bool:
+    async def _filter_request(self, route: Route):
+        """Drop images, fonts, audio preloads and trackers the extractors never read"""
+        request = route.request
+        if (request.resource_type in self.blocked_resources
+                or any(p in request.url for p in BLOCKED_URL_PATTERNS)):
+            await route.abort()
+        else:
+            await route.continue_()
+    
+    async def _limited(self, request: Callable[[], Awaitable], url: str):
+        """Run one navigation or request under the rate limiter and report how it went"""
+        await self.limiter.acquire()
+        started = time.monotonic()
+        try:
+            response = await request()
+        except (PlaywrightTimeoutError, requests.Timeout):
+            self.limiter.failure("timeout")
+            raise
+        if isinstance(response, requests.Response):
+            status = response.status_code
+        else:
+            status = response.status if response is not None else None
+        if is_throttle_status(status):
+            self.limiter.failure(f"HTTP {status}")
+            raise Throttled(status, url)
+        self.limiter.success(time.monotonic() - started)
+        return response
+    
+    async def _goto_ready(self, page: Page, exam_type: str, url: str):
+        """Open url and wait for the selector the extractor reads, not network idle"""
+        selector = READY_SELECTORS[exam_type]
+        with self.metrics.phase(exam_type, "goto"):
+            await self._limited(lambda: page.goto(url, wait_until="domcontentloaded"), url)
+        if self.recycle:
+            self.recycle.navigated(page)
+        try:
+            with self.metrics.phase(exam_type, "wait"):
+                await page.wait_for_function(READY_SCRIPT, arg=[selector, VIP_MARKERS, READY_SETTLE_MS],
+                                             polling=100, timeout=READY_TIMEOUT_MS)
+        except PlaywrightTimeoutError:
+            logger.debug(f"{selector} not found on {url}")
+    
+    async def _wait_for_result(self, page: Page) -> bool:
+        """Wait for the ket-qua page after submitting"""
+        try:
+            await page.wait_for_url(re.compile("ket-qua"), wait_until="domcontentloaded",
+                                    timeout=READY_TIMEOUT_MS)
+            await page.wait_for_selector(".question-block", state="attached",
+                                         timeout=READY_TIMEOUT_MS)
+            return True
+        except PlaywrightTimeoutError:
+            return False
+    
+    def _replaying(self, exam_type: str) -> bool:
+        return self.replay_submit and exam_type not in self.replay_disabled
+    
+    def _disable_replay(self, exam_type: str, reason: str):
+        logger.warning(f"{reason}, {exam_type} submit replay disabled")
+        self.replay_disabled.add(exam_type)
+    
+    async def _replay_answers(self, page: Page, exam_type: str, exam_id: int, html: str) -> Optional[Dict]:
+        """POST the captured submission for this exam and parse ket-qua from the response"""
+        template = self.submit_templates[exam_type]
+        url = template.url_for(exam_id)
+        with self.metrics.phase(exam_type, "submit"):
+            response = await self._limited(
+                lambda: self.context.request.post(url, form=template.payload(html), timeout=READY_TIMEOUT_MS), url)
+            body = await response.text()
+        if "/dang-nhap" in response.url:
+            raise SessionExpired(response.url)
+        if not response.ok or "ket-qua" not in response.url:
+            self._disable_replay(exam_type, f"Submit replay for {exam_type} #{exam_id} got "
+                                            f"{response.status} {response.url}")
+            return None
+        if not SubmitTemplate.result_for(response.url, exam_id):
+            self._disable_replay(exam_type, f"Submit replay for {exam_type} #{exam_id} returned the result "
+                                            f"of another exam ({response.url})")
+            return None
+        await self._archive_page(exam_type, exam_id, KIND_RESULT, response.url, body)
+        with self.metrics.phase(exam_type, "answers"):
+            return parse_answers(body)
+    
+    async def _get_answers(self, page: Page, exam_type: str, exam_id: int, html: Optional[str]) -> Dict:
+        """Submit the exam and read the correct answers.
+        
+        The exam state script has already picked the first option everywhere;
+        html is the exam page it returned, needed to replay or capture the submit.
+        """
+        if self._replaying(exam_type) and exam_type in self.submit_templates:
+            answers = await self._replay_answers(page, exam_type, exam_id, html)
+            if answers is not None:
+                return answers
+        
+        capture = self._replaying(exam_type) and exam_type not in self.submit_templates
+        submit_btn = await page.query_selector(".btn-submit")
+        if submit_btn:
+            await self.limiter.acquire()
+            started = time.monotonic()
+            with self.metrics.phase(exam_type, "submit"):
+                if not capture:
+                    await submit_btn.click()
+                else:
+                    await self._click_and_capture(page, submit_btn, exam_type, exam_id, html)
+                result_loaded = await self._wait_for_result(page)
+            if result_loaded:
+                self.limiter.success(time.monotonic() - started)
+            else:
+                self.limiter.failure("submit timeout")
+        
+        if "ket-qua" not in page.url:
+            return {}
+        with self.metrics.phase(exam_type, "answers"):
+            _, items, _ = await self._run_state(page, exam_type, exam_id, KIND_RESULT, ANSWERS)
+        return answers_from(items or [])
+    
+    async def _click_and_capture(self, page: Page, submit_btn, exam_type: str, exam_id: int, html: str):
+        """Click submit and record the form POST it sends as the replay template"""
+        def is_submit(request) -> bool:
+            return request.method == "POST" and request.resource_type in ("document", "xhr", "fetch")
+        
+        try:
+            async with page.expect_request(is_submit, timeout=READY_TIMEOUT_MS) as request_info:
+                await submit_btn.click()
+            request = await request_info.value
+        except PlaywrightTimeoutError:
+            self._disable_replay(exam_type, "Submit sent no POST request")
+            return
+        
+        content_type = (await request.all_headers()).get("content-type", "")
+        if "application/x-www-form-urlencoded" not in content_type:
+            self._disable_replay(exam_type, f"Cannot replay {content_type or 'unknown'} submission")
+            return
+        
+        template = SubmitTemplate(request.url, exam_id, request.post_data, html)
+        self.submit_templates[exam_type] = template
+        logger.info(f"Captured {exam_type} submit request {template.url}")
+    
+    async def _save_session(self):
+        """Persist cookies and local storage so the next run can skip login"""
+        if not self.session_file:
+            return
+        try:
+            await self.context.storage_state(path=self.session_file)
+            os.chmod(self.session_file, 0o600)
+        except Exception as e:
+            logger.warning(f"Cannot save session to {self.session_file}: {e}")
+    
+    async def _session_valid(self) -> bool:
+        """Check the current session with a single request, without rendering"""
+        try:
+            url = f"{BASE_URL}{SESSION_CHECK_PATH}"
+            response = await self._limited(lambda: self.context.request.get(url), url)
+            return response.ok and "/dang-nhap" not in response.url
+        except Exception as e:
+            logger.warning(f"Session check failed: {e}")
+            return False
+    
+    async def _seed_http(self, page: Page):
+        """Hand the browser session cookies to the HTTP engine and the audio downloader"""
+        if self.engine != "http" and not self.audio:
+            return
+        user_agent = await page.evaluate("navigator.userAgent")
+        cookies = await self.context.cookies()
+        if self.engine == "http":
+            if self.http is None:
+                self.http = HttpEngine(self.concurrency, user_agent)
+            self.http.set_cookies(cookies)
+        if self.audio:
+            self.audio.session.headers["User-Agent"] = user_agent
+            self.audio.set_cookies(cookies)
+    
+    async def ensure_session(self) -> bool:
+        """Reuse the saved session when it is still valid, otherwise login"""
+        if self.session_restored and await self._session_valid():
+            self.session_generation += 1
+            logger.info(f"Reusing saved session from {self.session_file}")
+            await self._seed_http(self.page)
+            return True
+        if self.session_restored:
+            logger.info("Saved session expired")
+        return await self.login()
+    
+    async def relogin(self, page: Page, generation: int) -> bool:
+        """Login again after the session expired mid-run.
+        
+        Workers that hit the expiry together only trigger one login: a worker
+        whose generation is already stale just reuses the new session.
+        """
+        async with self._login_lock:
+            if generation != self.session_generation:
+                return True
+            logger.warning("Session expired, logging in again")
+            return await self.login(page)
+    
+    async def login(self, page: Optional[Page] = None) -> bool:
         """Login to website"""
+        page = page or self.page
         try:
-            self.page.goto(f"{BASE_URL}/dang-nhap")
-            self.page.wait_for_load_state("networkidle")
+            url = f"{BASE_URL}/dang-nhap"
+            await self._limited(lambda: page.goto(url, wait_until="domcontentloaded"), url)
             
-            self.page.fill("#user_name", USERNAME)
-            self.page.fill("#password", PASSWORD)
-            self.page.click("button.btn-primary")
-            self.page.wait_for_load_state("networkidle")
+            await page.fill("#user_name", USERNAME)
+            await page.fill("#password", PASSWORD)
+            await page.click("button.btn-primary")
+            try:
+                await page.wait_for_url(lambda url: "/dang-nhap" not in url,
+                                        wait_until="domcontentloaded", timeout=READY_TIMEOUT_MS)
+            except PlaywrightTimeoutError:
+                pass
             
-            if "/dang-nhap" not in self.page.url:
+            if "/dang-nhap" not in page.url:
                 logger.info("Login successful")
+                self.session_generation += 1
+                await self._save_session()
+                await self._seed_http(page)
                 return True
             else:
                 logger.error("Login failed")
@@ -83,407 +626,458 @@ class VstepScraper:
             logger.error(f"Login error: {e}")
             return False
     
-    def _check_valid_page(self, exam_type: str) -> bool:
-        """Check if current page is valid exam page"""
-        current_url = self.page.url
-        content = self.page.content()
-        
-        # Check for wrong redirects
-        if "/tai-khoan" in current_url or "/dang-nhap" in current_url:
-            return False
+    async def _archive_page(self, exam_type: str, exam_id: int, kind: str, url: str, html: str):
+        """Compress and append the page in a thread, so a slow disk does not hold up the pages"""
+        if self.archive:
+            with self.metrics.phase(exam_type, "archive"):
+                await asyncio.to_thread(self.archive.add, exam_type, exam_id, kind, url, html)
+    
+    async def _run_state(self, page: Page, exam_type: str, exam_id: int, kind: str, schema: Dict,
+                         actions: Optional[List[Dict]] = None,
+                         keep_html: bool = False) -> Tuple[str, Optional[object], Optional[str]]:
+        """Status check, extraction and actions of one page state in a single evaluate().
         
-        # Check for VIP content
-        if "Đây là mã đề VIP" in content or "cần nâng cấp tài khoản" in content:
-            return False
-            
-        return True
+        Returns (status, extracted data, page HTML); the HTML is only fetched
+        when it is archived or keep_html is set.
+        """
+        args = {"markers": VIP_MARKERS, "act": bool(actions), "html": keep_html or bool(self.archive)}
+        result = await page.evaluate(compile_script(schema, actions), args)
+        if result["status"] == "login":
+            raise SessionExpired(result["url"])
+        html = result.get("html")
+        if html is not None:
+            await self._archive_page(exam_type, exam_id, kind, result["url"], html)
+        return result["status"], result["data"], html
+    
+    async def _browser_extract(self, page: Page, exam_type: str, exam_id: int, url: str,
+                               actions: Optional[List[Dict]] = None,
+                               keep_html: bool = False) -> Tuple[str, Optional[Dict], Optional[str]]:
+        """Render url and run its exam schema (and actions on valid exam pages)"""
+        await self._goto_ready(page, exam_type, url)
+        with self.metrics.phase(exam_type, "extract"):
+            return await self._run_state(page, exam_type, exam_id, KIND_EXAM, EXAM_SCHEMAS[exam_type],
+                                         actions, keep_html)
+    
+    async def _http_fetch(self, exam_type: str, exam_id: int, url: str) -> Tuple[str, Optional[str]]:
+        """Fetch url without a browser; the HTML of valid exam pages, still unparsed"""
+        with self.metrics.phase(exam_type, "goto"):
+            response = await self._limited(lambda: asyncio.to_thread(self.http.get, url), url)
+        if response.status_code in GONE_STATUSES:
+            # What the browser engine makes of the same page: no exam content
+            return STATUS_EMPTY, None
+        response.raise_for_status()
+        status = page_status(response.url, response.text)
+        await self._archive_page(exam_type, exam_id, KIND_EXAM, response.url, response.text)
+        return status, response.text if status == STATUS_OK else None
     
-    def scrape_listening(self, exam_id: int) -> Optional[Dict]:
+    async def scrape_listening(self, exam_id: int, page: Optional[Page] = None) -> Tuple[str, Optional[Dict]]:
         """Scrape listening exam with answers"""
-        exam_url = f"{BASE_URL}/luyen-de/lam-bai-nghe/{exam_id}"
+        page = page or self.page
+        exam_url = build_exam_url("listening", exam_id)
         
         try:
             logger.info(f"Scraping listening #{exam_id}")
-            self.page.goto(exam_url)
-            self.page.wait_for_load_state("networkidle")
+            status, exam_data, html = await self._browser_extract(
+                page, "listening", exam_id, exam_url, ANSWER_FIRST_OPTIONS, keep_html=self._replaying("listening"))
+            if status != STATUS_OK:
+                logger.warning(f"Skipping listening #{exam_id}: Invalid page ({status})")
+                return status, None
             
-            if not self._check_valid_page("listening"):
-                logger.warning(f"Skipping listening #{exam_id}: Invalid page")
-                return None
-            
-            # Extract questions
-            exam_data = self.page.evaluate("""
-                () => {
-                    const data = {
-                        title: document.title,
-                        audio_url: null,
-                        questions: []
-                    };
-                    
-                    const audio = document.querySelector('audio source, audio');
-                    if (audio) data.audio_url = audio.src || audio.querySelector('source')?.src;
-                    
-                    document.querySelectorAll('.question-block').forEach((block, i) => {
-                        const q = { number: i + 1, text: '', options: {} };
-                        
-                        block.querySelectorAll('.form-check, label').forEach(opt => {
-                            const text = opt.innerText.trim();
-                            const match = text.match(/^([A-D])[\\.\\)\\s:]\\s*(.+)/);
-                            if (match) q.options[match[1]] = match[2].trim();
-                        });
-                        
-                        if (Object.keys(q.options).length > 0) data.questions.push(q);
-                    });
-                    
-                    return data;
-                }
-            """)
-            
-            if len(exam_data['questions']) == 0:
+            if is_empty("listening", exam_data):
                 logger.warning(f"Skipping listening #{exam_id}: No questions")
-                return None
+                return STATUS_EMPTY, None
             
             # Submit to get answers
-            self.page.evaluate("""
-                () => {
-                    document.querySelectorAll('.question-block').forEach(q => {
-                        const radio = q.querySelector('input[type="radio"]');
-                        if (radio) radio.click();
-                    });
-                    window.confirm = () => true;
-                }
-            """)
-            time.sleep(0.3)
-            
-            submit_btn = self.page.query_selector(".btn-submit")
-            if submit_btn:
-                submit_btn.click()
-                self.page.wait_for_load_state("networkidle")
-                time.sleep(0.5)
-            
-            # Extract correct answers
-            if "ket-qua" in self.page.url:
-                answers = self.page.evaluate("""
-                    () => {
-                        const ans = {};
-                        document.querySelectorAll('.question-block').forEach((block, i) => {
-                            const success = block.querySelector('span.text-success');
-                            if (success) {
-                                const match = success.innerText.trim().match(/^([A-D])/);
-                                if (match) ans[i + 1] = match[1];
-                            }
-                        });
-                        return ans;
-                    }
-                """)
-                
-                for q in exam_data['questions']:
-                    q['correct_answer'] = answers.get(q['number']) or answers.get(str(q['number']))
-            
-            return {
-                "exam_type": "listening",
-                "exam_id": str(exam_id),
-                "title": exam_data['title'],
-                "source_url": exam_url,
-                "scraped_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
-                "audio_url": exam_data['audio_url'],
-                "questions": [{
-                    "question_number": q['number'],
-                    "options": q['options'],
-                    "correct_answer": q.get('correct_answer')
-                } for q in exam_data['questions']]
-            }
+            answers = await self._get_answers(page, "listening", exam_id, html)
+            return STATUS_OK, exam_record("listening", exam_id, exam_url, exam_data, answers)
             
+        except SessionExpired:
+            raise
         except Exception as e:
             logger.error(f"Error scraping listening #{exam_id}: {e}")
-            return None
+            return STATUS_ERROR, None
     
-    def scrape_reading(self, exam_id: int) -> Optional[Dict]:
+    async def scrape_reading(self, exam_id: int, page: Optional[Page] = None) -> Tuple[str, Optional[Dict]]:
         """Scrape reading exam with answers"""
-        exam_url = f"{BASE_URL}/luyen-de/lam-bai-doc/{exam_id}"
+        page = page or self.page
+        exam_url = build_exam_url("reading", exam_id)
         
         try:
             logger.info(f"Scraping reading #{exam_id}")
-            self.page.goto(exam_url)
-            self.page.wait_for_load_state("networkidle")
-            
-            if not self._check_valid_page("reading"):
-                logger.warning(f"Skipping reading #{exam_id}: Invalid page")
-                return None
+            status, exam_data, html = await self._browser_extract(
+                page, "reading", exam_id, exam_url, ANSWER_FIRST_OPTIONS, keep_html=self._replaying("reading"))
+            if status != STATUS_OK:
+                logger.warning(f"Skipping reading #{exam_id}: Invalid page ({status})")
+                return status, None
             
-            # Extract passages and questions
-            exam_data = self.page.evaluate("""
-                () => {
-                    const data = { title: document.title, passages: [] };
-                    
-                    document.querySelectorAll('.card, .passage').forEach((card, pi) => {
-                        const passage = { number: pi + 1, content: '', questions: [] };
-                        
-                        const body = card.querySelector('.card-body');
-                        if (body) passage.content = body.innerText.trim().substring(0, 3000);
-                        
-                        card.querySelectorAll('.question-block').forEach((block, qi) => {
-                            const q = { number: passage.questions.length + 1, options: {} };
-                            
-                            block.querySelectorAll('.form-check, label').forEach(opt => {
-                                const text = opt.innerText.trim();
-                                const match = text.match(/^([A-D])[\\.\\)\\s:]\\s*(.+)/);
-                                if (match) q.options[match[1]] = match[2].trim();
-                            });
-                            
-                            if (Object.keys(q.options).length > 0) passage.questions.push(q);
-                        });
-                        
-                        if (passage.questions.length > 0) data.passages.push(passage);
-                    });
-                    
-                    return data;
-                }
-            """)
-            
-            total_questions = sum(len(p['questions']) for p in exam_data['passages'])
-            if total_questions == 0:
+            if is_empty("reading", exam_data):
                 logger.warning(f"Skipping reading #{exam_id}: No questions")
-                return None
+                return STATUS_EMPTY, None
             
             # Submit to get answers
-            self.page.evaluate("""
-                () => {
-                    document.querySelectorAll('.question-block').forEach(q => {
-                        const radio = q.querySelector('input[type="radio"]');
-                        if (radio) radio.click();
-                    });
-                    window.confirm = () => true;
-                }
-            """)
-            time.sleep(0.3)
-            
-            submit_btn = self.page.query_selector(".btn-submit")
-            if submit_btn:
-                submit_btn.click()
-                self.page.wait_for_load_state("networkidle")
-                time.sleep(0.5)
-            
-            # Extract correct answers
-            answers = {}
-            if "ket-qua" in self.page.url:
-                answers = self.page.evaluate("""
-                    () => {
-                        const ans = {};
-                        document.querySelectorAll('.question-block').forEach((block, i) => {
-                            const success = block.querySelector('span.text-success');
-                            if (success) {
-                                const match = success.innerText.trim().match(/^([A-D])/);
-                                if (match) ans[i + 1] = match[1];
-                            }
-                        });
-                        return ans;
-                    }
-                """)
-            
-            # Format output
-            q_counter = 0
-            formatted_passages = []
-            for p in exam_data['passages']:
-                formatted_questions = []
-                for q in p['questions']:
-                    q_counter += 1
-                    formatted_questions.append({
-                        "question_number": q_counter,
-                        "options": q['options'],
-                        "correct_answer": answers.get(q_counter) or answers.get(str(q_counter))
-                    })
-                formatted_passages.append({
-                    "passage_number": p['number'],
-                    "content": p['content'],
-                    "questions": formatted_questions
-                })
-            
-            return {
-                "exam_type": "reading",
-                "exam_id": str(exam_id),
-                "title": exam_data['title'],
-                "source_url": exam_url,
-                "scraped_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
-                "passages": formatted_passages
-            }
+            answers = await self._get_answers(page, "reading", exam_id, html)
+            return STATUS_OK, exam_record("reading", exam_id, exam_url, exam_data, answers)
             
+        except SessionExpired:
+            raise
         except Exception as e:
             logger.error(f"Error scraping reading #{exam_id}: {e}")
-            return None
+            return STATUS_ERROR, None
     
-    def scrape_writing(self, exam_id: int) -> Optional[Dict]:
+    async def scrape_writing(self, exam_id: int, page: Optional[Page] = None) -> Tuple[str, Optional[Dict]]:
         """Scrape writing exam"""
-        exam_url = f"{BASE_URL}/luyen-de/lam-bai-viet/{exam_id}"
+        page = page or self.page
+        exam_url = build_exam_url("writing", exam_id)
         
         try:
             logger.info(f"Scraping writing #{exam_id}")
-            self.page.goto(exam_url)
-            self.page.wait_for_load_state("networkidle")
-            
-            if not self._check_valid_page("writing"):
-                logger.warning(f"Skipping writing #{exam_id}: Invalid page")
-                return None
+            status, exam_data, _ = await self._browser_extract(page, "writing", exam_id, exam_url)
             
-            exam_data = self.page.evaluate("""
-                () => {
-                    const data = { title: document.title, tasks: [] };
-                    
-                    document.querySelectorAll('.card').forEach((card, i) => {
-                        const task = { task_number: i + 1, prompt: '', word_limit: null };
-                        
-                        const body = card.querySelector('.card-body');
-                        if (body) {
-                            task.prompt = body.innerText.trim();
-                            const match = body.innerText.match(/(\\d+)\\s*(?:words|từ)/i);
-                            if (match) task.word_limit = parseInt(match[1]);
-                        }
-                        
-                        if (task.prompt) data.tasks.push(task);
-                    });
-                    
-                    return data;
-                }
-            """)
+            if exam_data is None:
+                logger.warning(f"Skipping writing #{exam_id}: Invalid page ({status})")
+                return status, None
             
-            if len(exam_data['tasks']) == 0:
+            if is_empty("writing", exam_data):
                 logger.warning(f"Skipping writing #{exam_id}: No tasks")
-                return None
+                return STATUS_EMPTY, None
             
-            return {
-                "exam_type": "writing",
-                "exam_id": str(exam_id),
-                "title": exam_data['title'],
-                "source_url": exam_url,
-                "scraped_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
-                "tasks": exam_data['tasks']
-            }
+            return STATUS_OK, exam_record("writing", exam_id, exam_url, exam_data)
             
+        except SessionExpired:
+            raise
         except Exception as e:
             logger.error(f"Error scraping writing #{exam_id}: {e}")
-            return None
+            return STATUS_ERROR, None
     
-    def scrape_speaking(self, exam_id: int) -> Optional[Dict]:
+    async def scrape_speaking(self, exam_id: int, page: Optional[Page] = None) -> Tuple[str, Optional[Dict]]:
         """Scrape speaking exam"""
-        exam_url = f"{BASE_URL}/luyen-de/lam-bai-noi/{exam_id}"
+        page = page or self.page
+        exam_url = build_exam_url("speaking", exam_id)
         
         try:
             logger.info(f"Scraping speaking #{exam_id}")
-            self.page.goto(exam_url)
-            self.page.wait_for_load_state("networkidle")
-            
-            if not self._check_valid_page("speaking"):
-                logger.warning(f"Skipping speaking #{exam_id}: Invalid page")
-                return None
+            status, exam_data, _ = await self._browser_extract(page, "speaking", exam_id, exam_url)
             
-            exam_data = self.page.evaluate("""
-                () => {
-                    const cleanPatterns = [
-                        /🎤 Ghi âm câu trả lời:/g,
-                        /⏱ Thời gian ghi âm.*/g,
-                        /⏺ Bắt đầu ghi âm/g,
-                        /⏹ Dừng ghi âm/g,
-                        /📤 Nộp bài/g,
-                        /⏱ --:--/g
-                    ];
-                    
-                    function clean(text) {
-                        if (!text) return '';
-                        let t = text;
-                        cleanPatterns.forEach(p => t = t.replace(p, ''));
-                        return t.replace(/\\n{3,}/g, '\\n\\n').trim();
-                    }
-                    
-                    const data = { title: document.title, parts: [] };
-                    
-                    document.querySelectorAll('.card').forEach((card, i) => {
-                        const part = { 
-                            part_number: i + 1, 
-                            topic: '', 
-                            instructions: '',
-                            follow_up_questions: [],
-                            speaking_time: null 
-                        };
-                        
-                        const body = card.querySelector('.card-body');
-                        if (body) {
-                            part.instructions = clean(body.innerText);
-                            
-                            const topicMatch = body.innerText.match(/Topic:\\s*(.+?)(?:\\n|$)/i);
-                            if (topicMatch) part.topic = topicMatch[1].trim();
-                            
-                            const timeMatch = body.innerText.match(/(\\d+)\\s*phút/i);
-                            if (timeMatch) part.speaking_time = parseInt(timeMatch[1]);
-                            
-                            const followUp = body.innerText.match(/Follow-up questions?:([\\s\\S]*?)(?:Ghi âm|$)/i);
-                            if (followUp) {
-                                const qs = followUp[1].match(/\\d+\\.\\s+[^\\d]+/g);
-                                if (qs) part.follow_up_questions = qs.map(q => q.trim());
-                            }
-                        }
-                        
-                        if (part.instructions.length > 20 || part.topic) {
-                            data.parts.push(part);
-                        }
-                    });
-                    
-                    return data;
-                }
-            """)
+            if exam_data is None:
+                logger.warning(f"Skipping speaking #{exam_id}: Invalid page ({status})")
+                return status, None
             
-            if len(exam_data['parts']) == 0:
+            if is_empty("speaking", exam_data):
                 logger.warning(f"Skipping speaking #{exam_id}: No parts")
-                return None
+                return STATUS_EMPTY, None
             
-            return {
-                "exam_type": "speaking",
-                "exam_id": str(exam_id),
-                "title": exam_data['title'],
-                "source_url": exam_url,
-                "scraped_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
-                "parts": exam_data['parts']
-            }
+            return STATUS_OK, exam_record("speaking", exam_id, exam_url, exam_data)
             
+        except SessionExpired:
+            raise
         except Exception as e:
             logger.error(f"Error scraping speaking #{exam_id}: {e}")
-            return None
+            return STATUS_ERROR, None
+    
+    async def probe(self, exam_type: str, exam_id: int) -> bool:
+        """Cheap existence check: one GET through the session, no rendering.
+        
+        VIP-locked exams count as existing; redirects and pages without the
+        extractor's selector do not. An expired session is renewed and the
+        probe repeated once.
+        """
+        generation = self.session_generation
+        try:
+            return await self._probe(exam_type, exam_id)
+        except SessionExpired:
+            self.limiter.failure("login redirect")
+            if not await self.relogin(self.page, generation):
+                logger.error(f"Re-login failed, probe {exam_type} #{exam_id} counts as missing")
+                return False
+        try:
+            return await self._probe(exam_type, exam_id)
+        except SessionExpired:
+            logger.error(f"Still logged out after re-login, probe {exam_type} #{exam_id} counts as missing")
+            return False
+    
+    async def _probe(self, exam_type: str, exam_id: int) -> bool:
+        url = build_exam_url(exam_type, exam_id)
+        # A throttled probe says nothing about the ID: retry after the limiter's pause
+        for _ in range(PROBE_ATTEMPTS):
+            try:
+                response = await self._limited(
+                    lambda: self.context.request.get(url, timeout=READY_TIMEOUT_MS), url)
+                break
+            except Throttled:
+                continue
+            except Exception as e:
+                logger.warning(f"Probe {exam_type} #{exam_id} failed: {e}")
+                return False
+        else:
+            logger.warning(f"Probe {exam_type} #{exam_id} throttled {PROBE_ATTEMPTS} times")
+            return False
+        if response.status in GONE_STATUSES:
+            return False
+        html = await response.text()
+        status = page_status(response.url, html)
+        if status == STATUS_VIP:
+            return True
+        if status != STATUS_OK:
+            return False
+        return BeautifulSoup(html, "html.parser").select_one(READY_SELECTORS[exam_type]) is not None
+    
+    async def discover(self, exam_type: str, start_id: int, gap: int = DEFAULT_GAP,
+                       stop: Optional[Callable[[], bool]] = None) -> List[int]:
+        """IDs that exist from start_id up to the live upper bound of a type
+        (probing ends once stop() returns True)"""
+        known = []
+        if self.manifest:
+            known = [i for i, status in self.manifest.statuses(exam_type).items()
+                     if status in (STATUS_OK, STATUS_VIP) and i >= start_id]
+        
+        async def probe(exam_id: int) -> bool:
+            return await self.probe(exam_type, exam_id)
+        
+        logger.info(f"Discovering {exam_type} exam IDs from #{start_id}")
+        return await discover_ids(probe, start_id, known, gap, concurrency=self.concurrency * 4, stop=stop)
     
     def save(self, data: Dict, exam_type: str, exam_id: int):
-        """Save exam data to JSON"""
-        output_dir = os.path.join(OUTPUT_DIR, exam_type)
-        os.makedirs(output_dir, exist_ok=True)
-        
-        filepath = os.path.join(output_dir, f"{exam_id}.json")
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        logger.info(f"Saved {filepath}")
-    
-    def scrape_all(self, exam_type: str, start_id: int, end_id: int):
-        """Scrape all exams of a type"""
-        scrape_func = {
-            "listening": self.scrape_listening,
-            "reading": self.scrape_reading,
-            "writing": self.scrape_writing,
-            "speaking": self.scrape_speaking
-        }.get(exam_type)
+        """Queue exam data for the output sink (written in batches)"""
+        self.sink.write(data)
+        logger.info(f"Saved {exam_type} #{exam_id}")
+    
+    async def _renew_leases(self):
+        """Keep this worker's leases alive while it is running"""
+        while True:
+            await asyncio.sleep(self.work_queue.lease_seconds / 3)
+            await asyncio.to_thread(self.work_queue.renew)
+    
+    async def _fetch(self, exam_type: str, exam_id: int, page: Page) -> Tuple[str, Optional[Dict], Optional[str]]:
+        """Pipeline fetch stage: (status, record, HTML left for the parse stage).
+        
+        The HTTP engine hands writing/speaking pages on unparsed; browser pages
+        are extracted in the page itself, so they arrive as records.
+        """
+        if not (self.http and exam_type in ("writing", "speaking")):
+            status, data = await self.scrape_funcs[exam_type](exam_id, page)
+            return status, data, None
+        try:
+            logger.info(f"Scraping {exam_type} #{exam_id}")
+            status, html = await self._http_fetch(exam_type, exam_id, build_exam_url(exam_type, exam_id))
+        except SessionExpired:
+            raise
+        except Exception as e:
+            logger.error(f"Error scraping {exam_type} #{exam_id}: {e}")
+            return STATUS_ERROR, None, None
+        if html is None:
+            logger.warning(f"Skipping {exam_type} #{exam_id}: Invalid page ({status})")
+        return status, None, html
+    
+    async def _parse_stage(self, item: Fetched) -> Fetched:
+        """Parse pages the HTTP engine fetched, in a thread"""
+        if item.html is None:
+            return item
+        url = build_exam_url(item.exam_type, item.exam_id)
+        try:
+            with self.metrics.phase(item.exam_type, "extract"):
+                exam_data = await asyncio.to_thread(parse_exam, item.exam_type, item.html, url)
+        except Exception as e:
+            logger.error(f"Error parsing {item.exam_type} #{item.exam_id}: {e}")
+            return item._replace(status=STATUS_ERROR, html=None)
+        if is_empty(item.exam_type, exam_data):
+            logger.warning(f"Skipping {item.exam_type} #{item.exam_id}: Nothing extracted")
+            return item._replace(status=STATUS_EMPTY, html=None)
+        return item._replace(data=exam_record(item.exam_type, item.exam_id, url, exam_data), html=None)
+    
+    async def _dedup_stage(self, item: Fetched) -> Fetched:
+        """Incremental dedup: checked against everything saved so far, any type"""
+        if not item.data:
+            return item
+        with self.metrics.phase(item.exam_type, "dedup"):
+            duplicate = await asyncio.to_thread(self.dedup.check, item.exam_type, item.exam_id, item.data)
+        if not duplicate:
+            return item
+        logger.info(f"Skipping {item.exam_type} #{item.exam_id}: {duplicate.kind} duplicate of "
+                    f"#{duplicate.canonical_id}")
+        return item._replace(status=STATUS_DUPLICATE, data=None)
+    
+    async def _audio_stage(self, item: Fetched) -> Fetched:
+        """Fetch the exam's audio and record its local path and checksum"""
+        data = item.data
+        if not data or not data.get("audio_url"):
+            return item
+        try:
+            with self.metrics.phase(item.exam_type, "audio"):
+                info = await self.audio.download(data["audio_url"])
+            data["audio_file"] = os.path.join(self.audio.root, info["path"])
+            data["audio_sha256"] = info["sha256"]
+            data["audio_bytes"] = info["bytes"]
+        except Exception as e:
+            # Saved without audio; the error status lets --only-failed fetch it again
+            logger.error(f"Audio download failed for {item.exam_type} #{item.exam_id}: {e}")
+            return item._replace(status=STATUS_ERROR)
+        return item
+    
+    async def _save_stage(self, item: Fetched):
+        """Write the record and the exam's outcome (manifest, negative cache, work queue)"""
+        exam_type, exam_id, status, data = item.exam_type, item.exam_id, item.status, item.data
+        if data:
+            with self.metrics.phase(exam_type, "save"):
+                await asyncio.to_thread(self.save, data, exam_type, exam_id)
+            if self.search_index:
+                with self.metrics.phase(exam_type, "index"):
+                    await asyncio.to_thread(self.search_index.add, data)
+            self.saved[exam_type] = self.saved.get(exam_type, 0) + 1
+        self.metrics.observe(exam_type, "exam", time.monotonic() - item.started)
+        await self._record_outcome(exam_type, exam_id, status, data)
+    
+    async def _record_outcome(self, exam_type: str, exam_id: int, status: str, data: Optional[Dict] = None):
+        """Metrics, manifest, negative cache and the exam's work queue lease.
+        
+        The disk writes run in threads: SQLite commits can wait on the dedup
+        thread's write lock, and the page workers share this event loop.
+        """
+        self.metrics.outcome(exam_type, status, export=False)
+        if self.metrics.prometheus_due():
+            await asyncio.to_thread(self.metrics.write_prometheus, self.metrics.prometheus_text())
+        if self.manifest:
+            await asyncio.to_thread(self.manifest.record, exam_type, exam_id, status,
+                                    content_hash(data) if data else None)
+        if self.negative_cache:
+            await asyncio.to_thread(self.negative_cache.record, exam_type, exam_id, status)
+        if self.work_queue:
+            # A failure goes back to the queue, retried up to MAX_ATTEMPTS times
+            finish = self.work_queue.fail if status == STATUS_ERROR else self.work_queue.complete
+            await asyncio.to_thread(finish, exam_type, exam_id)
+    
+    async def _stage_failed(self, item: Fetched, error: BaseException):
+        """A pipeline stage raised: the exam counts as failed, so --only-failed picks it up"""
+        await self._record_outcome(item.exam_type, item.exam_id, STATUS_ERROR)
+    
+    def _pipeline(self) -> Pipeline:
+        """parse -> dedup -> audio -> save, each behind a bounded queue"""
+        stages = [Stage("parse", self._parse_stage, self.concurrency)]
+        if self.dedup:
+            stages.append(Stage("dedup", self._dedup_stage))
+        if self.audio:
+            # Downloads run beside the page workers, bounded by the downloader
+            stages.append(Stage("audio", self._audio_stage, self.audio.concurrency))
+        stages.append(Stage("save", self._save_stage))
+        pipeline = Pipeline(stages, self.pipeline_queue, on_error=self._stage_failed)
+        for stage in stages:
+            self.metrics.gauge(f"pipeline_{stage.name}_queue", lambda name=stage.name: pipeline.depth(name))
+        return pipeline
+    
+    def _pending_ids(self, exam_type: str, exam_ids: List[int]) -> List[int]:
+        """Apply the shard, resume and negative cache filters to a type's IDs"""
+        if self.shard:
+            index, count = self.shard
+            exam_ids = [i for i in exam_ids if i % count == index]
+        # With --queue the queue, shared by all workers, knows what is finished
+        if self.manifest and self.resume and not self.work_queue:
+            total = len(exam_ids)
+            exam_ids = self.manifest.pending(exam_type, exam_ids, only_failed=self.resume == "only-failed")
+            logger.info(f"{self.resume}: {len(exam_ids)}/{total} {exam_type} exams left to scrape")
+        if self.negative_cache and not self.recheck:
+            dead = self.negative_cache.cached(exam_type)
+            skipped = [i for i in exam_ids if i in dead]
+            if skipped:
+                exam_ids = [i for i in exam_ids if i not in dead]
+                logger.info(f"Skipping {len(skipped)} {exam_type} IDs in the negative cache")
+        return exam_ids
+    
+    async def scrape_all(self, exam_type: str, start_id: int, end_id: int,
+                         exam_ids: Optional[List[int]] = None):
+        """Scrape all exams of a type, one worker per page in the pool.
+        
+        exam_ids (for example from discovery) replaces the start..end range.
+        """
+        if exam_ids is None:
+            exam_ids = list(range(start_id, end_id + 1))
+        await self.scrape_types({exam_type: exam_ids})
+    
+    async def scrape_types(self, id_sets: Dict[str, List[int]], weights: Optional[Dict[str, int]] = None,
+                           stop: Optional[Callable[[], bool]] = None):
+        """Scrape several exam types at once, interleaved over one page pool.
         
-        if not scrape_func:
-            logger.error(f"Unknown exam type: {exam_type}")
+        Every free page takes its next exam from the type picked by the
+        weighted scheduler; login, rate limit and dedup index are shared.
+        No new exam is started once stop() returns True.
+        """
+        streams = []
+        totals: Dict[str, int] = {}
+        for exam_type, exam_ids in id_sets.items():
+            if exam_type not in self.scrape_funcs:
+                logger.error(f"Unknown exam type: {exam_type}")
+                continue
+            exam_ids = self._pending_ids(exam_type, exam_ids)
+            if self.work_queue:
+                if self.resume == "only-failed":
+                    reopened = self.work_queue.reopen_failed(exam_type, exam_ids)
+                    logger.info(f"Reopened {reopened} failed {exam_type} tasks in {self.work_queue.path} "
+                                f"({self.work_queue.outstanding(exam_type)} unfinished)")
+                else:
+                    added = self.work_queue.enqueue(exam_type, exam_ids)
+                    logger.info(f"Queued {added} new {exam_type} tasks in {self.work_queue.path} "
+                                f"({self.work_queue.outstanding(exam_type)} unfinished)")
+            totals[exam_type] = len(exam_ids)
+            streams.append(ExamStream(exam_type, exam_ids, self.work_queue))
+        if not streams:
             return
+        self.saved = {}
+        pipeline = self._pipeline()
+        
+        def stopped() -> bool:
+            # A failed stage ends the run: no new exams, the queued ones drain
+            return pipeline.error is not None or bool(stop and stop())
         
-        success = 0
-        for exam_id in range(start_id, end_id + 1):
-            data = scrape_func(exam_id)
-            if data:
-                self.save(data, exam_type, exam_id)
-                success += 1
-            time.sleep(0.5)
+        scheduler = WeightedScheduler(streams, weights,
+                                      self.work_queue.poll_interval if self.work_queue else 0, stopped)
         
-        logger.info(f"Scraped {success}/{end_id - start_id + 1} {exam_type} exams")
+        async def worker(slot: int):
+            try:
+                while True:
+                    # The page may have been replaced by a recycle since the last exam
+                    page = self.pages[slot]
+                    exam_type, exam_id = await scheduler.next()
+                    if exam_type is None:
+                        return
+                    generation = self.session_generation
+                    started = time.monotonic()
+                    try:
+                        status, data, html = await self._fetch(exam_type, exam_id, page)
+                    except SessionExpired:
+                        self.limiter.failure("login redirect")
+                        if not await self.relogin(page, generation):
+                            logger.error(f"Re-login failed, stopping worker at {exam_type} #{exam_id}")
+                            return
+                        try:
+                            status, data, html = await self._fetch(exam_type, exam_id, page)
+                        except SessionExpired:
+                            logger.error(f"Still logged out after re-login, stopping worker at {exam_type} #{exam_id}")
+                            return
+                    # The page moves on while later stages finish this exam
+                    await pipeline.put(Fetched(exam_type, exam_id, status, data, started, html))
+                    await self._checkpoint(slot)
+            finally:
+                await self._worker_exit()
+        
+        heartbeat = asyncio.create_task(self._renew_leases()) if self.work_queue else None
+        pipeline.start()
+        try:
+            self._active_workers = len(self.pages)
+            await asyncio.gather(*(worker(slot) for slot in range(len(self.pages))))
+            await pipeline.close()
+        finally:
+            pipeline.cancel()
+            if heartbeat:
+                heartbeat.cancel()
+        
+        for exam_type, total in totals.items():
+            exam_times = self.metrics.phases.get((exam_type, "exam"))
+            logger.info(f"Scraped {self.saved.get(exam_type, 0)}/{total} {exam_type} exams "
+                        f"({self.metrics.exams_per_minute(exam_type):.1f}/min, "
+                        f"p50 {exam_times.quantile(0.5) if exam_times else 0:.2f}s, "
+                        f"rate limit {self.limiter.rate:.2f} req/s)")
 
 
-def remove_duplicates(exam_type: str):
-    """Remove duplicate exams based on content"""
+def remove_duplicates(exam_type: str, dedup: Optional[DedupIndex] = None):
+    """Remove saved exam files whose normalized content repeats an earlier ID"""
     path = os.path.join(OUTPUT_DIR, exam_type)
     if not os.path.exists(path):
         return
@@ -491,66 +1085,352 @@ def remove_duplicates(exam_type: str):
     seen = {}
     removed = 0
     
-    files = sorted(os.listdir(path), key=lambda x: int(x.replace('.json', '')))
+    files = sorted((f for f in os.listdir(path) if f.replace('.json', '').isdigit()),
+                   key=lambda x: int(x.replace('.json', '')))
     
     for f in files:
         filepath = os.path.join(path, f)
+        exam_id = int(f.replace('.json', ''))
         with open(filepath, 'r', encoding='utf-8') as file:
             data = json.load(file)
         
-        # Create content key based on exam type
-        if exam_type == "listening":
-            key = str(data.get('questions', [])[:3])
-        elif exam_type == "reading":
-            key = str([p.get('content', '')[:200] for p in data.get('passages', [])])
-        elif exam_type == "writing":
-            key = str([t.get('prompt', '')[:200] for t in data.get('tasks', [])])
-        elif exam_type == "speaking":
-            key = str([p.get('topic', '') + p.get('instructions', '')[:100] for p in data.get('parts', [])])
+        if dedup:
+            duplicate = dedup.check(exam_type, exam_id, data)
+            canonical = duplicate.canonical_id if duplicate else None
         else:
-            key = json.dumps(data)
+            key = exam_fingerprint(exam_type, data)
+            canonical = seen.get(key)
+            seen.setdefault(key, exam_id)
         
-        if key in seen:
+        if canonical is not None and canonical != exam_id:
             os.remove(filepath)
             removed += 1
-        else:
-            seen[key] = f
     
     print(f"Removed {removed} duplicate {exam_type} exams")
 
 
+def load_id_sets(path: str) -> Dict[str, List[int]]:
+    """Read exam IDs per type written by --discover"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return {t: [int(i) for i in ids] for t, ids in json.load(f).items()}
+
+
+def save_id_sets(path: str, id_sets: Dict[str, List[int]]):
+    """Write discovered IDs, keeping other types already in the file"""
+    merged = load_id_sets(path) if os.path.exists(path) else {}
+    merged.update(id_sets)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(merged, f)
+    logger.info(f"Saved discovered IDs to {path}")
+
+
+def parse_exam(exam_type: str, html: str, url: str) -> Dict:
+    """Extract an exam page's data with the HTML parsers"""
+    if exam_type == "listening":
+        return parse_listening(html, url)
+    return {"reading": parse_reading, "writing": parse_writing, "speaking": parse_speaking}[exam_type](html)
+
+
+async def refresh_id_sets(scraper: "VstepScraper", manifest: CrawlManifest, types: List[str],
+                          args, budget: RefreshBudget) -> Dict[str, List[int]]:
+    """--refresh: new IDs above the highest known one first, then known IDs, stalest first.
+    
+    Probing for new IDs may use DISCOVERY_SHARE of the budget, split between the types.
+    """
+    id_sets = {}
+    for t in types:
+        highest = highest_known(manifest, t)
+        new_ids = await scraper.discover(t, highest + 1 if highest else args.start, args.discover_gap,
+                                         budget.portion(DISCOVERY_SHARE / len(types)))
+        due = refresh_order(manifest, t, args.refresh_min_age)
+        id_sets[t] = new_ids + [exam_id for exam_id, _ in due if exam_id not in new_ids]
+        logger.info(f"Refresh {t}: {len(new_ids)} new IDs above #{highest or args.start - 1}, "
+                    f"{len(due)} known IDs due (highest staleness {due[0][1] if due else 0:.2f})")
+    return id_sets
+
+
+def replay_exam(root: str, exam: ArchiveEntry, result: Optional[ArchiveEntry]) -> Tuple[str, Optional[Dict]]:
+    """Re-extract one archived exam with the HTML parsers (runs in a worker process)"""
+    _, html = read_page(root, exam.segment, exam.offset, exam.length)
+    try:
+        status = page_status(exam.url, html)
+    except SessionExpired:
+        return STATUS_ERROR, None
+    if status != STATUS_OK:
+        return status, None
+    
+    exam_data = parse_exam(exam.exam_type, html, exam.url)
+    if is_empty(exam.exam_type, exam_data):
+        return STATUS_EMPTY, None
+    
+    answers = {}
+    if result:
+        answers = parse_answers(read_page(root, result.segment, result.offset, result.length)[1])
+    return STATUS_OK, exam_record(exam.exam_type, exam.exam_id, exam.url, exam_data, answers,
+                                  scraped_at=exam.fetched_at)
+
+
+def replay(args):
+    """Run the extractors over the page archive: no browser, network or login"""
+    archive = PageArchive(args.archive)
+    sink = BatchWriter(open_sink(args.output_format, args.output or OUTPUT_DIR), batch_size=args.batch_size)
+    dedup = DedupIndex(args.manifest, near=args.dedup == "near", threshold=args.near_threshold) \
+        if args.dedup != "off" else None
+    metrics = Metrics(args.metrics_prom)
+    search_index = IndexWriter(args.search_index) if args.search_index else None
+    types = EXAM_TYPES if args.type == "all" else [args.type]
+    
+    try:
+        with ProcessPoolExecutor(args.replay_workers) as pool:
+            for t in types:
+                exams = archive.entries(t)
+                results = {e.exam_id: e for e in archive.entries(t, KIND_RESULT)}
+                started = time.monotonic()
+                saved = 0
+                outcomes = pool.map(replay_exam, repeat(args.archive), exams,
+                                    [results.get(e.exam_id) for e in exams], chunksize=16)
+                for exam, (status, data) in zip(exams, outcomes):
+                    if data and dedup and dedup.check(t, exam.exam_id, data):
+                        status, data = STATUS_DUPLICATE, None
+                    if data:
+                        sink.write(data)
+                        if search_index:
+                            search_index.add(data)
+                        saved += 1
+                    metrics.outcome(t, status)
+                logger.info(f"Replayed {len(exams)} archived {t} exams in {time.monotonic() - started:.1f}s, "
+                            f"saved {saved}")
+    finally:
+        sink.close()
+        if search_index:
+            search_index.close()
+        archive.close()
+        if dedup:
+            dedup.close()
+        metrics.write_prometheus()
+        if args.metrics_json:
+            metrics.write_json(args.metrics_json)
+
+
+async def run(args):
+    manifest = CrawlManifest(args.manifest)
+    negative_cache = NegativeCache(args.manifest, args.negative_ttl)
+    resume = "only-failed" if args.only_failed else "resume" if args.resume else None
+    metrics = Metrics(args.metrics_prom)
+    dedup = DedupIndex(args.manifest, near=args.dedup == "near", threshold=args.near_threshold) \
+        if args.dedup != "off" else None
+    sink = BatchWriter(open_sink(args.output_format, args.output or OUTPUT_DIR), batch_size=args.batch_size)
+    audio = AudioDownloader(args.audio_dir, args.manifest, args.audio_concurrency) \
+        if args.download_audio else None
+    work_queue = LeaseQueue(args.queue, args.lease_seconds, args.worker_id) if args.queue else None
+    archive = PageArchive(args.archive) if args.archive_pages else None
+    search_index = IndexWriter(args.search_index) if args.search_index else None
+    scraper = VstepScraper(headless=not args.visible, concurrency=args.concurrency,
+                           session_file=None if args.fresh_login else args.session_file,
+                           blocked_resources=[r for r in args.block_resources.split(",") if r],
+                           engine=args.engine, replay_submit=not args.ui_submit,
+                           manifest=manifest, resume=resume,
+                           negative_cache=negative_cache, recheck=args.recheck,
+                           limiter=AdaptiveRateLimiter(args.rate, args.min_rate, args.max_rate,
+                                                       burst=args.concurrency),
+                           metrics=metrics, sink=sink, dedup=dedup,
+                           audio=audio, shard=args.shard, work_queue=work_queue,
+                           archive=archive,
+                           recycle=RecyclePolicy(args.recycle_page, args.recycle_context,
+                                                 args.recycle_browser, args.recycle_rss),
+                           pipeline_queue=args.pipeline_queue, search_index=search_index)
+    
+    try:
+        await scraper.start()
+        
+        if not await scraper.ensure_session():
+            logger.error("Login failed")
+            return
+        
+        types = EXAM_TYPES if args.type == "all" else [args.type]
+        
+        if args.refresh:
+            budget = RefreshBudget(scraper.limiter, args.refresh_requests, args.refresh_time)
+            started_at = time.time()
+            await scraper.scrape_types(await refresh_id_sets(scraper, manifest, types, args, budget),
+                                       args.type_weights, budget.exhausted)
+            changed = sum(manifest.changed_since(t, started_at) for t in types)
+            logger.info(f"Refresh used {budget.requests} requests in {budget.elapsed:.0f}s"
+                        f"{' (budget reached)' if budget.exhausted() else ''}: "
+                        f"{sum(scraper.saved.values())} exams saved, {changed} changed")
+            return
+        
+        id_sets = load_id_sets(args.ids_file) if args.ids_file and not args.discover else {}
+        if args.discover:
+            for t in types:
+                id_sets[t] = await scraper.discover(t, args.start, args.discover_gap)
+            save_id_sets(args.ids_file or DISCOVERED_IDS_FILE, id_sets)
+            if args.discover_only:
+                return
+        
+        # All requested types run interleaved over the same page pool
+        await scraper.scrape_types(
+            {t: id_sets[t] if t in id_sets else list(range(args.start, args.end + 1)) for t in types},
+            args.type_weights)
+        
+        # Duplicates are already skipped while scraping; this pass covers files from older runs
+        if args.cleanup:
+            if args.output_format == "files":
+                sink.flush()
+                for t in types:
+                    remove_duplicates(t, dedup)
+            else:
+                logger.warning("--cleanup only works with --output-format files, skipped")
+        
+    finally:
+        await scraper.stop()
+        sink.close()
+        manifest.close()
+        negative_cache.close()
+        if dedup:
+            dedup.close()
+        if audio:
+            audio.close()
+        if work_queue:
+            work_queue.release()
+            work_queue.close()
+        if archive:
+            archive.close()
+        if search_index:
+            search_index.close()
+        # Last, so a failed export cannot leave leases or databases open
+        try:
+            metrics.write_prometheus()
+            if args.metrics_json:
+                metrics.write_json(args.metrics_json)
+                logger.info(f"Metrics written to {args.metrics_json}")
+        except Exception as e:
+            logger.error(f"Writing metrics failed: {e}")
+
+
 def main():
     parser = argparse.ArgumentParser(description="VSTEP Exam Scraper")
     parser.add_argument("--type", choices=["listening", "reading", "writing", "speaking", "all"], 
                         required=True, help="Exam type to scrape")
     parser.add_argument("--start", type=int, default=1, help="Start exam ID")
     parser.add_argument("--end", type=int, default=100, help="End exam ID")
+    parser.add_argument("--discover", action="store_true",
+                        help="Probe for existing IDs from --start up to the live maximum (ignores --end), then scrape them")
+    parser.add_argument("--discover-only", action="store_true",
+                        help="With --discover: only write the ID set, do not scrape")
+    parser.add_argument("--discover-gap", type=int, default=DEFAULT_GAP,
+                        help="Missing IDs in a row that end the discovered range")
+    parser.add_argument("--ids-file",
+                        help=f"Scrape the IDs listed in this file; --discover writes here (default {DISCOVERED_IDS_FILE})")
+    parser.add_argument("--type-weights", type=parse_weights, default=dict(DEFAULT_WEIGHTS),
+                        help="Share of pages per type with --type all (default: listening=1,reading=1,writing=2,speaking=2)")
     parser.add_argument("--visible", action="store_true", help="Show browser window")
     parser.add_argument("--cleanup", action="store_true", help="Remove duplicate exams after scraping")
+    parser.add_argument("--output-format", choices=FORMATS, default="files",
+                        help="files: one JSON per exam; jsonl[.gz|.zst]: one file per type; sqlite: one row per exam")
+    parser.add_argument("--output", help=f"Output directory, or .sqlite file for --output-format sqlite (default {OUTPUT_DIR})")
+    parser.add_argument("--batch-size", type=int, default=100, help="Exams written to the output per batch")
+    parser.add_argument("--manifest", default=os.path.join(OUTPUT_DIR, "manifest.sqlite"),
+                        help="SQLite file recording the outcome of every exam ID")
+    resume_group = parser.add_mutually_exclusive_group()
+    resume_group.add_argument("--resume", action="store_true",
+                              help="Skip IDs the manifest already records as done (ok, VIP, invalid, empty)")
+    resume_group.add_argument("--only-failed", action="store_true",
+                              help="Only retry IDs the manifest records as errors")
+    resume_group.add_argument("--refresh", action="store_true",
+                              help="Recrawl known IDs by how likely they changed, after new IDs above the known "
+                                   "maximum (ignores --end)")
+    parser.add_argument("--refresh-requests", type=int, default=0,
+                        help="With --refresh: stop starting exams after this many requests (0: no limit)")
+    parser.add_argument("--refresh-time", type=parse_duration, default=0,
+                        help="With --refresh: stop starting exams after this long, e.g. 2h (0: no limit)")
+    parser.add_argument("--refresh-min-age", type=parse_duration, default=DEFAULT_MIN_AGE,
+                        help="With --refresh: skip exams scraped more recently than this (default 1d)")
+    parser.add_argument("--negative-ttl", type=parse_ttls, default=parse_ttls(os.getenv("VSTEP_NEGATIVE_TTL", "")),
+                        help="How long dead IDs are skipped, per reason (default: vip=7d,invalid=7d,empty=30d; 0 disables)")
+    parser.add_argument("--recheck", action="store_true",
+                        help="Visit IDs in the negative cache anyway (results still update the cache)")
+    split_group = parser.add_mutually_exclusive_group()
+    split_group.add_argument("--shard", type=parse_shard,
+                             help="Only scrape IDs with id %% n == i (e.g. 0/4), one process per shard")
+    split_group.add_argument("--queue",
+                             help="Shared SQLite work queue: start every worker with the same arguments and file")
+    parser.add_argument("--lease-seconds", type=float, default=DEFAULT_LEASE_SECONDS,
+                        help="With --queue: how long a dead worker's task stays leased before another takes it")
+    parser.add_argument("--worker-id", help="With --queue: name of this worker (default host:pid)")
+    parser.add_argument("--archive-pages", action="store_true",
+                        help="Keep the raw HTML of every exam and ket-qua page in --archive for --replay")
+    parser.add_argument("--archive", default=os.path.join(OUTPUT_DIR, "archive"),
+                        help="Page archive directory (compressed segments plus index.sqlite)")
+    parser.add_argument("--replay", action="store_true",
+                        help="Re-extract every archived exam offline instead of crawling (ignores --start/--end)")
+    parser.add_argument("--replay-workers", type=int, default=os.cpu_count(),
+                        help="Processes parsing archived pages with --replay")
+    parser.add_argument("--download-audio", action="store_true",
+                        help="Download listening audio (stored once per content hash) and add its path to the exam")
+    parser.add_argument("--audio-dir", default=os.path.join(OUTPUT_DIR, "audio"),
+                        help="Where downloaded audio is stored")
+    parser.add_argument("--audio-concurrency", type=int, default=4, help="Audio files downloaded at once")
+    parser.add_argument("--dedup", choices=["off", "exact", "near"], default="exact",
+                        help="Skip exams whose content repeats an earlier ID (near: also whitespace/order changes)")
+    parser.add_argument("--near-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Estimated similarity (0-1) above which --dedup near treats exams as duplicates")
+    parser.add_argument("--search-index",
+                        help="Add saved exams to this search index directory (see search.py), e.g. data/search")
+    parser.add_argument("--metrics-json", default=os.path.join(OUTPUT_DIR, "metrics.json"),
+                        help="Write per-phase timings and outcome counts here at the end of the run")
+    parser.add_argument("--metrics-prom", default=os.getenv("VSTEP_METRICS_PROM"),
+                        help="Prometheus textfile refreshed during the run (node_exporter textfile collector)")
+    parser.add_argument("--recycle-page", type=int, default=0,
+                        help="Replace a page after this many navigations (0: never)")
+    parser.add_argument("--recycle-context", type=int, default=0,
+                        help="Replace the browser context and all pages after this many navigations, keeping the session")
+    parser.add_argument("--recycle-browser", type=int, default=0,
+                        help="Restart Chromium after this many navigations, keeping the session")
+    parser.add_argument("--recycle-rss", type=int, default=0,
+                        help="Replace the context when Chromium renderers use more than this many MB (Linux)")
+    parser.add_argument("--pipeline-queue", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="Exams waiting between two pipeline stages before the stage in front waits")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Number of pages scraping in parallel (shared login session)")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE,
+                        help="Starting request rate (req/s), adapted while running")
+    parser.add_argument("--min-rate", type=float, default=DEFAULT_MIN_RATE,
+                        help="Lowest request rate after backing off")
+    parser.add_argument("--max-rate", type=float, default=DEFAULT_MAX_RATE,
+                        help="Highest request rate the limiter may reach")
+    parser.add_argument("--engine", choices=["browser", "http"], default="browser",
+                        help="http: fetch writing/speaking pages without rendering (listening/reading still use the browser)")
+    parser.add_argument("--ui-submit", action="store_true",
+                        help="Always click the submit button instead of replaying the captured request")
+    parser.add_argument("--block-resources", default=",".join(BLOCKED_RESOURCES),
+                        help="Comma-separated resource types to drop (e.g. image,media,font; empty to allow all)")
+    parser.add_argument("--session-file", default=SESSION_FILE,
+                        help="File storing the logged-in session between runs")
+    parser.add_argument("--fresh-login", action="store_true",
+                        help="Ignore and do not write the saved session")
     
     args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.pipeline_queue < 1:
+        parser.error("--pipeline-queue must be at least 1")
+    if not 0 < args.min_rate <= args.max_rate:
+        parser.error("--min-rate must be positive and not above --max-rate")
+    if args.discover_only and not args.discover:
+        parser.error("--discover-only requires --discover")
+    if args.refresh and args.queue:
+        parser.error("--refresh orders IDs by staleness and cannot use --queue (which leases by ID)")
+    if args.recheck and args.queue:
+        parser.error("--recheck cannot use --queue: finished tasks stay done, start a new queue file instead")
     
-    scraper = VstepScraper(headless=not args.visible)
-    
-    try:
-        scraper.start()
-        
-        if not scraper.login():
-            logger.error("Login failed")
-            return
-        
-        if args.type == "all":
-            for t in ["listening", "reading", "writing", "speaking"]:
-                scraper.scrape_all(t, args.start, args.end)
-                if args.cleanup:
-                    remove_duplicates(t)
-        else:
-            scraper.scrape_all(args.type, args.start, args.end)
-            if args.cleanup:
-                remove_duplicates(args.type)
-        
-    finally:
-        scraper.stop()
+    if args.replay:
+        replay(args)
+    else:
+        asyncio.run(run(args))
 
 
 if __name__ == "__main__":
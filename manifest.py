@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Crawl manifest - persistent record of every (exam_type, exam_id) outcome
+Lets an interrupted or repeated run skip the work it already finished
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Crawl outcome of one exam
+STATUS_OK = "ok"
+STATUS_VIP = "vip"
+STATUS_INVALID = "invalid"
+STATUS_EMPTY = "empty"
+STATUS_ERROR = "error"
+STATUS_DUPLICATE = "duplicate"
+
+# Outcomes a resumed run does not retry
+DONE_STATUSES = (STATUS_OK, STATUS_VIP, STATUS_INVALID, STATUS_EMPTY, STATUS_DUPLICATE)
+
+# Seconds before a dead exam ID is checked again, per reason
+DAY = 24 * 3600
+NEGATIVE_TTLS = {STATUS_VIP: 7 * DAY, STATUS_INVALID: 7 * DAY, STATUS_EMPTY: 30 * DAY}
+
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": DAY, "w": 7 * DAY}
+
+# Columns added after the first release, created on older manifests
+CHANGE_COLUMNS = {
+    "changes": "INTEGER NOT NULL DEFAULT 0",  # times the content hash differed from the last one
+    "first_seen": "REAL",  # epoch of the first successful scrape
+    "checked_at": "REAL",  # epoch of the latest successful scrape
+    "changed_at": "REAL",  # epoch of the latest scrape that found new content
+}
+
+# Fields that change on every scrape without the exam changing
+VOLATILE_FIELDS = ("scraped_at",)
+
+
+def content_hash(data: Dict) -> str:
+    """Stable hash of an exam record, ignoring volatile fields"""
+    stable = {k: v for k, v in data.items() if k not in VOLATILE_FIELDS}
+    payload = json.dumps(stable, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def parse_duration(value: str) -> float:
+    """Parse '90', '30m', '12h', '7d' or '2w' into seconds"""
+    value = value.strip().lower()
+    if value and value[-1] in DURATION_UNITS:
+        return float(value[:-1]) * DURATION_UNITS[value[-1]]
+    return float(value)
+
+
+def parse_ttls(spec: str) -> Dict[str, float]:
+    """Parse 'vip=7d,empty=30d' into per-reason TTLs on top of the defaults"""
+    ttls = dict(NEGATIVE_TTLS)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        reason, _, value = item.partition("=")
+        if reason not in NEGATIVE_TTLS:
+            raise ValueError(f"Unknown negative cache reason: {reason}")
+        ttls[reason] = parse_duration(value)
+    return ttls
+
+
+class CrawlManifest:
+    """SQLite manifest with one row per (exam_type, exam_id)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # record() runs in a worker thread of the crawl pipeline, one call at a time
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS exams (
+                exam_type TEXT NOT NULL,
+                exam_id INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                content_hash TEXT,
+                attempts INTEGER NOT NULL DEFAULT 1,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (exam_type, exam_id)
+            )
+        """)
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(exams)")}
+        for column, definition in CHANGE_COLUMNS.items():
+            if column not in existing:
+                self.conn.execute(f"ALTER TABLE exams ADD COLUMN {column} {definition}")
+        self.conn.commit()
+
+    def record(self, exam_type: str, exam_id: int, status: str, data_hash: Optional[str] = None):
+        """Store the latest outcome of an exam; a new content hash counts as a change"""
+        now = time.time()
+        checked_at = now if data_hash else None
+        changed = """excluded.content_hash IS NOT NULL AND exams.content_hash IS NOT NULL
+                     AND excluded.content_hash != exams.content_hash"""
+        self.conn.execute(f"""
+            INSERT INTO exams (exam_type, exam_id, status, content_hash, updated_at, first_seen, checked_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (exam_type, exam_id) DO UPDATE SET
+                status = excluded.status,
+                content_hash = COALESCE(excluded.content_hash, exams.content_hash),
+                attempts = exams.attempts + 1,
+                updated_at = excluded.updated_at,
+                changes = exams.changes + ({changed}),
+                changed_at = CASE WHEN {changed} THEN excluded.checked_at ELSE exams.changed_at END,
+                first_seen = COALESCE(exams.first_seen, excluded.first_seen),
+                checked_at = COALESCE(excluded.checked_at, exams.checked_at)
+        """, (exam_type, exam_id, status, data_hash, time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(now)),
+              checked_at, checked_at))
+        self.conn.commit()
+
+    def statuses(self, exam_type: str) -> Dict[int, str]:
+        """Latest status per exam ID of a type"""
+        rows = self.conn.execute(
+            "SELECT exam_id, status FROM exams WHERE exam_type = ?", (exam_type,))
+        return dict(rows.fetchall())
+
+    def history(self, exam_type: str) -> List[Tuple[int, str, int, float, float]]:
+        """(exam_id, status, changes, first_seen, last_checked) per known ID; manifests
+        written before change tracking fall back to the last update time"""
+        rows = self.conn.execute(
+            "SELECT exam_id, status, changes, first_seen, checked_at, updated_at FROM exams WHERE exam_type = ?",
+            (exam_type,))
+        result = []
+        for exam_id, status, changes, first_seen, checked_at, updated_at in rows:
+            updated = time.mktime(time.strptime(updated_at, "%Y-%m-%dT%H:%M:%S"))
+            checked = checked_at or updated
+            result.append((exam_id, status, changes, first_seen or checked, checked))
+        return result
+
+    def changed_since(self, exam_type: str, since: float) -> int:
+        """Exams of a type whose content changed at a scrape after `since` (epoch)"""
+        row = self.conn.execute("""
+            SELECT COUNT(*) FROM exams WHERE exam_type = ? AND changed_at >= ?
+        """, (exam_type, since)).fetchone()
+        return row[0]
+
+    def pending(self, exam_type: str, exam_ids: Iterable[int], only_failed: bool = False) -> List[int]:
+        """IDs still to scrape: not finished yet, or only the failed ones"""
+        known = self.statuses(exam_type)
+        if only_failed:
+            return [i for i in exam_ids if known.get(i) == STATUS_ERROR]
+        return [i for i in exam_ids if known.get(i) not in DONE_STATUSES]
+
+    def close(self):
+        self.conn.close()
+
+
+class NegativeCache:
+    """Exam IDs known to be dead (VIP, redirected, empty), skipped until their TTL expires.
+
+    The TTL is applied when reading, so changing it also affects entries
+    cached by earlier runs. A TTL of 0 disables caching for that reason.
+    """
+
+    def __init__(self, path: str, ttls: Optional[Dict[str, float]] = None):
+        self.ttls = dict(NEGATIVE_TTLS if ttls is None else ttls)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # record() runs in a worker thread of the crawl pipeline, one call at a time
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS negative_cache (
+                exam_type TEXT NOT NULL,
+                exam_id INTEGER NOT NULL,
+                reason TEXT NOT NULL,
+                cached_at REAL NOT NULL,
+                PRIMARY KEY (exam_type, exam_id)
+            )
+        """)
+        self.conn.commit()
+
+    def record(self, exam_type: str, exam_id: int, status: str):
+        """Cache a dead outcome, or forget the ID once it scrapes fine"""
+        if self.ttls.get(status, 0) > 0:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO negative_cache VALUES (?, ?, ?, ?)",
+                (exam_type, exam_id, status, time.time()))
+        elif status == STATUS_OK:
+            self.conn.execute(
+                "DELETE FROM negative_cache WHERE exam_type = ? AND exam_id = ?", (exam_type, exam_id))
+        else:
+            return
+        self.conn.commit()
+
+    def cached(self, exam_type: str) -> Dict[int, str]:
+        """Unexpired dead IDs of a type with their reason"""
+        now = time.time()
+        rows = self.conn.execute(
+            "SELECT exam_id, reason, cached_at FROM negative_cache WHERE exam_type = ?", (exam_type,))
+        return {exam_id: reason for exam_id, reason, cached_at in rows
+                if now - cached_at < self.ttls.get(reason, 0)}
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Run metrics - per-phase timing histograms, outcome counters and throughput
+Exported as a JSON summary at the end of a run and as a Prometheus textfile
+(node_exporter textfile collector format) refreshed while the run goes on
+"""
+
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Histogram bucket upper bounds in seconds (5 ms .. ~82 s, doubling)
+BUCKETS = [0.005 * 2 ** i for i in range(15)]
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; memory does not grow with the run"""
+
+    def __init__(self, buckets: List[float] = BUCKETS):
+        self.bounds = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        index = len(self.bounds)
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating inside its bucket"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+    def summary(self) -> Dict:
+        data = {"count": self.count, "sum": round(self.sum, 4), "max": round(self.max, 4)}
+        for q in QUANTILES:
+            data[f"p{int(q * 100)}"] = round(self.quantile(q), 4)
+        return data
+
+
+class Metrics:
+    """Collects timings and outcomes per exam type for one run"""
+
+    def __init__(self, prom_path: Optional[str] = None, prom_interval: float = 15.0):
+        self.prom_path = prom_path
+        self.prom_interval = prom_interval
+        self.phases: Dict[Tuple[str, str], Histogram] = {}
+        self.outcomes: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.first_seen: Dict[str, float] = {}
+        self.last_seen: Dict[str, float] = {}
+        self.gauges: Dict[str, Callable[[], float]] = {}
+        self.started = time.time()
+        self._last_prom = 0.0
+
+    def observe(self, exam_type: str, phase: str, seconds: float):
+        self.first_seen.setdefault(exam_type, time.monotonic() - seconds)
+        key = (exam_type, phase)
+        if key not in self.phases:
+            self.phases[key] = Histogram()
+        self.phases[key].observe(seconds)
+
+    @contextmanager
+    def phase(self, exam_type: str, phase: str) -> Iterator[None]:
+        """Time the enclosed block (awaits included) as one phase"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(exam_type, phase, time.monotonic() - started)
+
+    def outcome(self, exam_type: str, status: str, export: bool = True):
+        """Count a finished exam and refresh the textfile when due (unless
+        export is False: async callers write it with prometheus_due())"""
+        now = time.monotonic()
+        self.first_seen.setdefault(exam_type, now)
+        self.last_seen[exam_type] = now
+        self.outcomes[(exam_type, status)] += 1
+        if export:
+            self.maybe_write_prometheus()
+
+    def gauge(self, name: str, read: Callable[[], float]):
+        """Register a value read at export time (e.g. the current rate limit)"""
+        self.gauges[name] = read
+
+    def exams_per_minute(self, exam_type: str) -> float:
+        done = sum(n for (t, _), n in self.outcomes.items() if t == exam_type)
+        if exam_type not in self.last_seen:
+            return 0.0  # timed phases but no finished exam yet
+        elapsed = max(self.last_seen[exam_type] - self.first_seen[exam_type], 1.0)
+        return done * 60 / elapsed
+
+    def exam_types(self) -> List[str]:
+        types = {t for t, _ in self.outcomes} | {t for t, _ in self.phases}
+        return sorted(types)
+
+    def summary(self) -> Dict:
+        data = {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "duration_seconds": round(time.time() - self.started, 2),
+            "gauges": {name: read() for name, read in self.gauges.items()},
+            "exam_types": {},
+        }
+        for exam_type in self.exam_types():
+            data["exam_types"][exam_type] = {
+                "outcomes": {s: n for (t, s), n in self.outcomes.items() if t == exam_type},
+                "exams_per_minute": round(self.exams_per_minute(exam_type), 2),
+                "phases": {p: h.summary() for (t, p), h in sorted(self.phases.items()) if t == exam_type},
+            }
+        return data
+
+    def write_json(self, path: str):
+        _write_atomic(path, json.dumps(self.summary(), indent=2, ensure_ascii=False))
+
+    def prometheus_text(self) -> str:
+        lines = [
+            "# HELP vstep_phase_seconds Time spent per scrape phase",
+            "# TYPE vstep_phase_seconds histogram",
+        ]
+        for (exam_type, phase), h in sorted(self.phases.items()):
+            labels = f'exam_type="{exam_type}",phase="{phase}"'
+            cumulative = 0
+            for bound, n in zip(h.bounds, h.counts):
+                cumulative += n
+                lines.append(f'vstep_phase_seconds_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+            lines.append(f'vstep_phase_seconds_bucket{{{labels},le="+Inf"}} {h.count}')
+            lines.append(f"vstep_phase_seconds_sum{{{labels}}} {h.sum:.6f}")
+            lines.append(f"vstep_phase_seconds_count{{{labels}}} {h.count}")
+
+        lines += ["# HELP vstep_exams_total Exams finished by outcome",
+                  "# TYPE vstep_exams_total counter"]
+        for (exam_type, status), n in sorted(self.outcomes.items()):
+            lines.append(f'vstep_exams_total{{exam_type="{exam_type}",outcome="{status}"}} {n}')
+
+        lines += ["# HELP vstep_exams_per_minute Exams finished per minute",
+                  "# TYPE vstep_exams_per_minute gauge"]
+        for exam_type in self.exam_types():
+            lines.append(f'vstep_exams_per_minute{{exam_type="{exam_type}"}} {self.exams_per_minute(exam_type):.3f}')
+
+        for name, read in sorted(self.gauges.items()):
+            lines += [f"# TYPE vstep_{name} gauge", f"vstep_{name} {read():g}"]
+        lines.append(f"vstep_last_update_timestamp_seconds {time.time():.0f}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, text: Optional[str] = None):
+        """Write the textfile; text rendered earlier may be passed in (to write it from another thread)"""
+        if self.prom_path:
+            self._last_prom = time.monotonic()
+            _write_atomic(self.prom_path, text if text is not None else self.prometheus_text())
+
+    def prometheus_due(self) -> bool:
+        return bool(self.prom_path) and time.monotonic() - self._last_prom >= self.prom_interval
+
+    def maybe_write_prometheus(self):
+        if self.prometheus_due():
+            self.write_prometheus()
+
+
+def _write_atomic(path: str, text: str):
+    """Write via a temp file so readers never see a half-written file"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp, path)
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+HTML parsers - run the extraction schemas in schemas.py over server HTML
+Used by the browserless HTTP engine and --replay; output matches the script
+the browser runs for the same schema
+"""
+
+import copy
+import re
+from typing import Dict, List, Optional, Pattern
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup, NavigableString, Tag
+
+from schemas import ANSWERS, LISTENING, READING, SPEAKING, WRITING
+
+# Elements that never contribute to innerText
+HIDDEN_TAGS = {"script", "style", "noscript", "template", "head", "title", "meta", "link"}
+
+# Elements rendered as blocks: innerText puts a line break around them
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "dd", "details", "dialog", "div", "dl", "dt",
+    "fieldset", "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6",
+    "header", "hr", "li", "main", "nav", "ol", "pre", "section", "summary", "table", "ul",
+    "tr", "caption", "thead", "tbody", "tfoot",
+}
+
+
+def _is_hidden(el: Tag) -> bool:
+    if el.name in HIDDEN_TAGS or el.has_attr("hidden"):
+        return True
+    style = el.get("style", "").replace(" ", "").lower()
+    return "display:none" in style
+
+
+def _collect_text(el: Tag, items: List):
+    """Walk el like innerText: strings for text, ints for required line breaks"""
+    for child in el.children:
+        if isinstance(child, NavigableString):
+            if type(child) is NavigableString:
+                items.append(re.sub(r"\s+", " ", str(child)))
+            continue
+        if not isinstance(child, Tag) or _is_hidden(child):
+            continue
+        if child.name == "br":
+            items.append("\n")
+            continue
+        breaks = 2 if child.name == "p" else 1 if child.name in BLOCK_TAGS else 0
+        if breaks:
+            items.append(breaks)
+        _collect_text(child, items)
+        if child.name in ("td", "th"):
+            items.append("\t")
+        if breaks:
+            items.append(breaks)
+
+
+def inner_text(el: Optional[Tag]) -> str:
+    """Approximate HTMLElement.innerText for server-rendered markup"""
+    if el is None:
+        return ""
+    items: List = []
+    _collect_text(el, items)
+
+    out = []
+    pending = 0
+    for item in items:
+        if isinstance(item, int):
+            pending = max(pending, item)
+        elif item == " " and (pending or not out):
+            # Collapsible whitespace at the start of a line is dropped
+            continue
+        elif item:
+            if pending and out:
+                out.append("\n" * pending)
+            pending = 0
+            out.append(item)
+
+    lines = []
+    for line in "".join(out).split("\n"):
+        lines.append(re.sub(r" {2,}", " ", line).strip(" "))
+    return "\n".join(lines).strip("\n")
+
+
+def page_title(soup: BeautifulSoup) -> str:
+    """document.title: whitespace-collapsed text of <title>"""
+    if soup.title is None:
+        return ""
+    return " ".join(soup.title.get_text().split())
+
+
+def _regex(pattern: str, flags: str = "") -> Pattern:
+    return re.compile(pattern, re.I if "i" in (flags or "") else 0)
+
+
+def _size(value) -> int:
+    return 0 if value is None else len(value)
+
+
+def _post(value, steps: List):
+    for step in steps or []:
+        if value is None:
+            break
+        name, *args = step if isinstance(step, list) else [step]
+        if isinstance(value, list):
+            value = [_post(v, [step]) for v in value]
+        elif name == "trim":
+            value = value.strip()
+        elif name == "int":
+            value = int(value)
+        elif name == "truncate":
+            value = value[:args[0]]
+        elif name == "replace":
+            value = _regex(args[0], args[1]).sub(args[2], value)
+    return value
+
+
+def _evaluate(node: Dict, ctx: Tag, soup: BeautifulSoup, page_url: str):
+    """Evaluate one schema node (see schemas.py) against ctx, like the injected script"""
+    kind = node["type"]
+    value = None
+    if kind == "object":
+        value = {name: _evaluate(field, ctx, soup, page_url) for name, field in node["fields"].items()}
+    elif kind == "list":
+        value = []
+        for i, el in enumerate(ctx.select(node["selector"])):
+            item = {}
+            for name, field in node["fields"].items():
+                if field["type"] == "index":
+                    item[name] = len(value) + 1 if field.get("count") == "kept" else i + 1
+                else:
+                    item[name] = _evaluate(field, el, soup, page_url)
+            if not node.get("keep") or any(_size(item[name]) >= n for name, n in node["keep"]):
+                value.append(item)
+    elif kind == "title":
+        value = page_title(soup)
+    elif kind == "text":
+        value = inner_text(ctx.select_one(node["selector"]) if node.get("selector") else ctx)
+    elif kind == "attr":
+        el = ctx.select_one(node["selector"]) if node.get("selector") else ctx
+        if el is not None:
+            value = el.get(node["attr"]) or None
+            if value and node.get("url"):
+                value = urljoin(page_url, value)
+            if value is None and node.get("fallback"):
+                value = _evaluate(node["fallback"], el, soup, page_url)
+    elif kind == "regex":
+        text = _evaluate(node["from"], ctx, soup, page_url)
+        if text is not None:
+            pattern = _regex(node["pattern"], node.get("flags"))
+            if node.get("all"):
+                value = [m.group(0) for m in pattern.finditer(text)] or None
+            else:
+                match = pattern.search(text)
+                value = match.group(node.get("group", 0)) if match else None
+    elif kind == "pairs":
+        value = {}
+        pattern = _regex(node["pattern"])
+        for el in ctx.select(node["selector"]):
+            match = pattern.search(inner_text(el).strip())
+            if match:
+                value[match.group(1)] = match.group(2).strip()
+    elif kind == "const":
+        value = copy.deepcopy(node["value"])
+    value = _post(value, node.get("post"))
+    if value is None and "default" in node:
+        value = copy.deepcopy(node["default"])
+    return value
+
+
+def extract(schema: Dict, html: str, page_url: str = ""):
+    """Run an extraction schema over server HTML"""
+    soup = BeautifulSoup(html, "html.parser")
+    return _evaluate(schema, soup, soup, page_url)
+
+
+def parse_listening(html: str, page_url: str = "") -> Dict:
+    """Listening exam page: title, audio_url and questions with options"""
+    return extract(LISTENING, html, page_url)
+
+
+def parse_reading(html: str) -> Dict:
+    """Reading exam page: passages with their questions"""
+    return extract(READING, html)
+
+
+def parse_writing(html: str) -> Dict:
+    """Writing exam page: one task per card"""
+    return extract(WRITING, html)
+
+
+def parse_speaking(html: str) -> Dict:
+    """Speaking exam page: parts with topic, time and follow-up questions"""
+    return extract(SPEAKING, html)
+
+
+def answers_from(items: List[Dict]) -> Dict[int, str]:
+    """Answer list extracted with the ANSWERS schema as {question number: letter}"""
+    return {item["number"]: item["answer"] for item in items}
+
+
+def parse_answers(html: str) -> Dict[int, str]:
+    """ket-qua page: correct option letter per question number"""
+    return answers_from(extract(ANSWERS, html))
+
+
+def submit_fields(html: str) -> Dict[str, str]:
+    """Form fields sent when every question is answered with its first option.
+
+    Mirrors what the browser posts after clicking the first radio of each
+    .question-block: the hidden inputs of the answer form plus one value per
+    radio group.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    blocks = soup.select(".question-block")
+    form = blocks[0].find_parent("form") if blocks else None
+
+    fields = {}
+    for hidden in (form or soup).select("input[type=hidden][name]"):
+        fields[hidden["name"]] = hidden.get("value", "")
+    for block in blocks:
+        radio = block.select_one('input[type="radio"][name]')
+        if radio is not None:
+            fields[radio["name"]] = radio.get("value", "on")
+    return fields
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Crawl pipeline - asyncio stages connected by bounded queues
+Page workers only fetch; parsing, dedup, audio and writing run as later
+stages, so the browser never waits on them. A full queue makes the stage
+before it wait (backpressure), keeping memory flat when one falls behind.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 32
+
+# Stage function: returns the item for the next stage, or None to drop it
+StageFunc = Callable[[Any], Awaitable[Optional[Any]]]
+# Called with an item whose stage raised, and the exception
+ErrorFunc = Callable[[Any, BaseException], Awaitable[None]]
+
+_DONE = object()
+
+
+class Stage:
+    def __init__(self, name: str, func: StageFunc, workers: int = 1):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.queue: Optional[asyncio.Queue] = None
+        self.tasks: List[asyncio.Task] = []
+
+
+class Pipeline:
+    """Runs items through the stages in order; each stage has its own
+    workers reading from a bounded input queue.
+
+    An exception in a stage drops the item after handing it to on_error
+    (which records the failure) and is raised again from close(). The
+    producer should stop feeding items once error is set; items already
+    queued still run through.
+    """
+
+    def __init__(self, stages: List[Stage], queue_size: int = DEFAULT_QUEUE_SIZE,
+                 on_error: Optional[ErrorFunc] = None):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.on_error = on_error
+        self.error: Optional[BaseException] = None
+
+    def start(self):
+        for i, stage in enumerate(self.stages):
+            stage.queue = asyncio.Queue(self.queue_size)
+            nxt = self.stages[i + 1] if i + 1 < len(self.stages) else None
+            stage.tasks = [asyncio.create_task(self._run(stage, nxt), name=f"pipeline-{stage.name}")
+                           for _ in range(stage.workers)]
+
+    def depth(self, name: str) -> int:
+        """Items waiting in front of a stage"""
+        stage = next(s for s in self.stages if s.name == name)
+        return stage.queue.qsize() if stage.queue else 0
+
+    async def _run(self, stage: Stage, nxt: Optional[Stage]):
+        while True:
+            item = await stage.queue.get()
+            if item is _DONE:
+                return
+            try:
+                result = await stage.func(item)
+            except Exception as e:
+                logger.error(f"Pipeline stage {stage.name} failed: {e}")
+                if self.error is None:
+                    self.error = e
+                await self._failed(item, e)
+                continue
+            if result is not None and nxt:
+                await nxt.queue.put(result)
+
+    async def _failed(self, item, error: BaseException):
+        if self.on_error is None:
+            return
+        try:
+            await self.on_error(item, error)
+        except Exception as e:
+            logger.error(f"Recording a pipeline failure failed: {e}")
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    async def put(self, item):
+        """Hand an item to the first stage, waiting while its queue is full"""
+        await self.stages[0].queue.put(item)
+
+    async def close(self):
+        """Let every queued item through all stages, then stop the workers"""
+        for stage in self.stages:
+            for _ in stage.tasks:
+                await stage.queue.put(_DONE)
+            await asyncio.gather(*stage.tasks)
+        self._raise_error()
+
+    def cancel(self):
+        for stage in self.stages:
+            for task in stage.tasks:
+                task.cancel()
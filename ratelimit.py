@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Adaptive rate limiter - token bucket shared by every request of a run
+The refill rate follows AIMD: it creeps up while the site answers fast and
+is halved (with a jittered pause) on timeouts, 429/5xx or login redirects
+"""
+
+import asyncio
+import logging
+import random
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATE = 2.0
+DEFAULT_MIN_RATE = 0.2
+DEFAULT_MAX_RATE = 10.0
+
+
+class Throttled(Exception):
+    """Raised when the site answers 429 or 5xx"""
+
+    def __init__(self, status: int, url: str):
+        super().__init__(f"HTTP {status} for {url}")
+        self.status = status
+
+
+def is_throttle_status(status: Optional[int]) -> bool:
+    return status is not None and (status == 429 or status >= 500)
+
+
+class AdaptiveRateLimiter:
+    """Token bucket whose rate (requests/s) is tuned by additive increase,
+    multiplicative decrease"""
+
+    def __init__(self, rate: float = DEFAULT_RATE, min_rate: float = DEFAULT_MIN_RATE,
+                 max_rate: float = DEFAULT_MAX_RATE, burst: float = 1.0,
+                 increase: float = 0.05, decrease: float = 0.5,
+                 slow_seconds: float = 5.0, base_backoff: float = 1.0, max_backoff: float = 60.0,
+                 log_interval: float = 30.0):
+        self.min_rate = min_rate
+        self.max_rate = max(max_rate, min_rate)
+        self.rate = min(max(rate, min_rate), self.max_rate)
+        self.burst = max(1.0, burst)
+        self.increase = increase
+        self.decrease = decrease
+        self.slow_seconds = slow_seconds
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.log_interval = log_interval
+
+        self.tokens = self.burst
+        self.failures = 0
+        self.backoffs = 0
+        self.requests = 0
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._last_log = self._updated
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Wait for a token; waiters are served in order"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.requests += 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def success(self, elapsed: float):
+        """A request finished fine in `elapsed` seconds"""
+        self.failures = 0
+        if elapsed < self.slow_seconds:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+        self._maybe_log()
+
+    def failure(self, reason: str):
+        """Timeout, 429/5xx or login redirect: halve the rate and pause everyone"""
+        now = time.monotonic()
+        self.failures += 1
+        self.backoffs += 1
+        backoff = min(self.max_backoff, self.base_backoff * 2 ** (self.failures - 1))
+        pause = random.uniform(backoff / 2, backoff)
+        self._paused_until = max(self._paused_until, now + pause)
+        self.tokens = 0
+        # Workers failing together count as one congestion event
+        if now - self._last_decrease >= 1 / self.rate:
+            old_rate = self.rate
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._last_decrease = now
+            logger.warning(f"Backing off ({reason}): rate {old_rate:.2f} -> {self.rate:.2f} req/s, "
+                           f"pausing {pause:.1f}s")
+
+    def _maybe_log(self):
+        now = time.monotonic()
+        if now - self._last_log >= self.log_interval:
+            self._last_log = now
+            logger.info(f"Rate limit: {self.rate:.2f} req/s")
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Browser recycling - keeps Chromium memory bounded on long runs
+A page is replaced after a number of navigations; the context (all pages)
+or the whole browser after a number of navigations, and the context also
+when renderer memory passes a limit. The session moves over as storage
+state, so recycling never needs a new login.
+"""
+
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PAGE = "page"
+CONTEXT = "context"
+BROWSER = "browser"
+
+MB = 1024 * 1024
+DEFAULT_RSS_INTERVAL = 60.0
+
+
+def chromium_memory() -> Optional[Dict[str, int]]:
+    """RSS in bytes of the Chromium processes started by this one, as
+    {"renderer": ..., "total": ...}; None where /proc is not available"""
+    if not os.path.isdir("/proc/self"):
+        return None
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    children: Dict[int, list] = {}
+    rss: Dict[int, int] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", 'r') as f:
+                # Fields after "(comm)": state, ppid, ... rss is the 22nd
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        pid = int(entry)
+        children.setdefault(int(fields[1]), []).append(pid)
+        rss[pid] = int(fields[21]) * page_size
+
+    usage = {"renderer": 0, "total": 0}
+    stack = list(children.get(os.getpid(), []))
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, []))
+        try:
+            with open(f"/proc/{pid}/cmdline", 'rb') as f:
+                cmdline = f.read()
+        except OSError:
+            continue
+        if b"chrom" not in cmdline and b"headless_shell" not in cmdline:
+            continue  # the Playwright driver
+        usage["total"] += rss.get(pid, 0)
+        if b"--type=renderer" in cmdline:
+            usage["renderer"] += rss.get(pid, 0)
+    return usage
+
+
+def format_memory(usage: Optional[Dict[str, int]]) -> str:
+    if usage is None:
+        return "memory unknown"
+    return f"renderers {usage['renderer'] / MB:.0f} MB, Chromium total {usage['total'] / MB:.0f} MB"
+
+
+class RecyclePolicy:
+    """Decides when pages, the context or the browser are due for a restart.
+
+    Thresholds of 0 are disabled. Navigations are counted per page, per
+    context and per browser; renderer memory is read at most every
+    rss_interval seconds.
+    """
+
+    def __init__(self, page_navigations: int = 0, context_navigations: int = 0,
+                 browser_navigations: int = 0, rss_limit_mb: int = 0,
+                 rss_interval: float = DEFAULT_RSS_INTERVAL):
+        self.page_navigations = page_navigations
+        self.context_navigations = context_navigations
+        self.browser_navigations = browser_navigations
+        self.rss_limit = rss_limit_mb * MB
+        self.rss_interval = rss_interval
+        self.pages: Dict[int, int] = {}
+        self.context_count = 0
+        self.browser_count = 0
+        self.recycles = {PAGE: 0, CONTEXT: 0, BROWSER: 0}
+        self.memory: Optional[Dict[str, int]] = None
+        self._last_check = time.monotonic()
+        if self.rss_limit and chromium_memory() is None:
+            logger.warning("Cannot read process memory here, --recycle-rss is ignored")
+            self.rss_limit = 0
+
+    @property
+    def enabled(self) -> bool:
+        return any((self.page_navigations, self.context_navigations, self.browser_navigations, self.rss_limit))
+
+    def navigated(self, page):
+        self.pages[id(page)] = self.pages.get(id(page), 0) + 1
+        self.context_count += 1
+        self.browser_count += 1
+
+    def page_due(self, page) -> bool:
+        return bool(self.page_navigations) and self.pages.get(id(page), 0) >= self.page_navigations
+
+    def read_memory(self) -> Optional[Dict[str, int]]:
+        self._last_check = time.monotonic()
+        self.memory = chromium_memory()
+        return self.memory
+
+    def pool_due(self) -> Optional[str]:
+        """BROWSER or CONTEXT when the whole pool should be recycled, else None"""
+        if self.browser_navigations and self.browser_count >= self.browser_navigations:
+            return BROWSER
+        if self.context_navigations and self.context_count >= self.context_navigations:
+            return CONTEXT
+        if self.rss_limit and time.monotonic() - self._last_check >= self.rss_interval:
+            usage = self.read_memory()
+            logger.info(f"Chromium memory: {format_memory(usage)} (limit {self.rss_limit / MB:.0f} MB)")
+            if usage and usage["renderer"] >= self.rss_limit:
+                return CONTEXT
+        return None
+
+    def recycled(self, level: str, page=None):
+        """Reset the counters covered by a recycle"""
+        self.recycles[level] += 1
+        if level == PAGE:
+            self.pages.pop(id(page), None)
+            return
+        self.pages.clear()
+        self.context_count = 0
+        if level == BROWSER:
+            self.browser_count = 0
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Staleness-aware recrawl (main.py --refresh)
+Known exams are revisited in order of how likely they are to have changed
+since their last scrape, estimated from how often their content hash
+changed before; exams that never change drift to the back. New IDs above
+the known maximum are scraped first. A run stops at its request or time
+budget, so the requests go to the exams most likely to be stale.
+"""
+
+import math
+import time
+from typing import Callable, List, Optional, Tuple
+
+from manifest import DAY, STATUS_ERROR, STATUS_OK, CrawlManifest
+
+# Prior for the change rate: one change per PRIOR_INTERVAL before anything is observed
+PRIOR_INTERVAL = 30 * DAY
+DEFAULT_MIN_AGE = DAY
+# Most of the budget a refresh may spend probing for new IDs, leaving the rest for stale exams
+DISCOVERY_SHARE = 0.25
+
+
+def change_rate(changes: int, observed: float, prior: float = PRIOR_INTERVAL) -> float:
+    """Estimated content changes per second: (changes + 1) / (observed time + prior)"""
+    return (changes + 1) / (max(0.0, observed) + prior)
+
+
+def staleness(rate: float, age: float) -> float:
+    """Probability that an exam changing at `rate` has changed within `age` seconds"""
+    return 1 - math.exp(-rate * max(0.0, age))
+
+
+def refresh_order(manifest: CrawlManifest, exam_type: str, min_age: float = DEFAULT_MIN_AGE,
+                  now: Optional[float] = None) -> List[Tuple[int, float]]:
+    """Known IDs last scraped at least min_age ago as (exam_id, staleness), stalest first.
+
+    Dead IDs (VIP, redirected, empty) are included; the negative cache
+    decides when they are due again.
+    """
+    now = time.time() if now is None else now
+    order = []
+    for exam_id, status, changes, first_seen, checked in manifest.history(exam_type):
+        age = now - checked
+        if age < min_age and status != STATUS_ERROR:
+            continue
+        score = staleness(change_rate(changes, checked - first_seen), age)
+        if status == STATUS_ERROR:
+            score = 1.0  # never scraped successfully
+        order.append((exam_id, score))
+    order.sort(key=lambda item: (-item[1], item[0]))
+    return order
+
+
+def highest_known(manifest: CrawlManifest, exam_type: str) -> Optional[int]:
+    """Highest ID that scraped fine, where the search for new exams starts"""
+    ids = [i for i, status in manifest.statuses(exam_type).items() if status == STATUS_OK]
+    return max(ids) if ids else None
+
+
+class RefreshBudget:
+    """Stops a refresh after max_requests rate-limited requests or max_seconds (0: no limit)"""
+
+    def __init__(self, limiter, max_requests: int = 0, max_seconds: float = 0):
+        self.limiter = limiter
+        self.max_requests = max_requests
+        self.max_seconds = max_seconds
+        self.started = time.monotonic()
+        self.start_requests = limiter.requests
+
+    @property
+    def requests(self) -> int:
+        return self.limiter.requests - self.start_requests
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def exhausted(self) -> bool:
+        return (bool(self.max_requests) and self.requests >= self.max_requests
+                or bool(self.max_seconds) and self.elapsed >= self.max_seconds)
+
+    def portion(self, fraction: float) -> Callable[[], bool]:
+        """stop() callable for a step that may use `fraction` of the budget from now on"""
+        requests, elapsed = self.requests, self.elapsed
+
+        def exhausted() -> bool:
+            return (self.exhausted()
+                    or bool(self.max_requests) and self.requests - requests >= self.max_requests * fraction
+                    or bool(self.max_seconds) and self.elapsed - elapsed >= self.max_seconds * fraction)
+        return exhausted
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Exam scheduling for --type all - the four types are scraped as interleaved
+streams by one page pool instead of one after another. Each free page takes
+its next exam from the stream chosen by smooth weighted round robin, so a
+stream that runs dry simply leaves its share to the others.
+"""
+
+import asyncio
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from workqueue import LeaseQueue
+
+# Share of dispatches per type. Writing and speaking pages are cheap (no
+# submit step), so they get more turns and drain alongside the slow types.
+DEFAULT_WEIGHTS = {"listening": 1, "reading": 1, "writing": 2, "speaking": 2}
+
+
+def parse_weights(spec: str) -> Dict[str, int]:
+    """Parse 'listening=1,writing=3' on top of the default weights"""
+    weights = dict(DEFAULT_WEIGHTS)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        exam_type, _, value = item.partition("=")
+        if exam_type not in DEFAULT_WEIGHTS:
+            raise ValueError(f"Unknown exam type: {exam_type}")
+        weights[exam_type] = int(value)
+        if weights[exam_type] < 1:
+            raise ValueError(f"Weight of {exam_type} must be at least 1")
+    return weights
+
+
+class ExamStream:
+    """Exam IDs of one type still to scrape, from a list or the shared work queue"""
+
+    def __init__(self, exam_type: str, exam_ids: Iterable[int], work_queue: Optional[LeaseQueue] = None):
+        self.exam_type = exam_type
+        self.work_queue = work_queue
+        self.ids = deque(() if work_queue else exam_ids)
+
+    async def take(self) -> Optional[int]:
+        """Next exam ID, or None if nothing is available right now"""
+        if self.work_queue:
+            # May wait on other workers' write locks: off the event loop
+            return await asyncio.to_thread(self.work_queue.lease, self.exam_type)
+        return self.ids.popleft() if self.ids else None
+
+    async def finished(self) -> bool:
+        """Nothing left now or later (leases held by other workers may still come back)"""
+        if self.work_queue:
+            return not await asyncio.to_thread(self.work_queue.outstanding, self.exam_type)
+        return not self.ids
+
+
+class WeightedScheduler:
+    """Smooth weighted round robin over the exam streams (as in nginx upstreams)"""
+
+    def __init__(self, streams: List[ExamStream], weights: Optional[Dict[str, int]] = None,
+                 poll_interval: float = 10.0, stop: Optional[Callable[[], bool]] = None):
+        self.streams = streams
+        self.stop = stop
+        self.weights = {s.exam_type: (weights or DEFAULT_WEIGHTS).get(s.exam_type, 1) for s in streams}
+        self.current = {s.exam_type: 0 for s in streams}
+        self.poll_interval = poll_interval
+
+    async def _pick(self) -> Tuple[Optional[ExamStream], Optional[int], bool]:
+        """One scheduling round: (stream, exam ID, any stream unfinished)"""
+        active = [s for s in self.streams if not await s.finished()]
+        if not active:
+            return None, None, False
+        total = sum(self.weights[s.exam_type] for s in active)
+        for s in active:
+            self.current[s.exam_type] += self.weights[s.exam_type]
+        # Highest credit first; a stream with nothing leasable right now passes its turn on
+        for stream in sorted(active, key=lambda s: -self.current[s.exam_type]):
+            exam_id = await stream.take()
+            if exam_id is not None:
+                self.current[stream.exam_type] -= total
+                return stream, exam_id, True
+        return None, None, True
+
+    async def next(self) -> Tuple[Optional[str], Optional[int]]:
+        """(exam_type, exam_id) for a free page, or (None, None) when all streams
+        are done or stop() says the run is over"""
+        while True:
+            if self.stop and self.stop():
+                return None, None
+            stream, exam_id, unfinished = await self._pick()
+            if stream:
+                return stream.exam_type, exam_id
+            if not unfinished:
+                return None, None
+            await asyncio.sleep(self.poll_interval)
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Declarative extraction schemas - what to read from each page state
+One schema per state drives both extractors:
+  compile_script()  one JavaScript function per state, run with a single
+                    page.evaluate() (status check, extraction, radio clicks
+                    and optionally the HTML in one CDP round-trip)
+  parsers.extract() the same schema over server HTML with BeautifulSoup
+
+Schema nodes are plain JSON so they can be passed into the page:
+  {"type": "object", "fields": {name: node}}       evaluate fields in order
+  {"type": "list", "selector", "fields", "keep"}   one object per match; keep
+                                                   = [[field, min_length], ...]
+                                                   (any of them is enough)
+  {"type": "index", "count": "all" | "kept"}       1-based position in a list
+  {"type": "title"}                                document.title
+  {"type": "text", "selector"?}                    innerText ("" if missing)
+  {"type": "attr", "selector", "attr", "url"?, "fallback"?}
+  {"type": "regex", "from", "pattern", "flags"?, "group"?, "all"?}
+  {"type": "pairs", "selector", "pattern"}         {group 1: trimmed group 2}
+  {"type": "const", "value"}
+Any node may have "post" (processors applied in order) and "default"
+(used when the value is null). Processors: "trim", "int",
+["truncate", n], ["replace", pattern, flags, replacement].
+"""
+
+import json
+from functools import lru_cache
+from typing import Dict
+
+OPTION_PATTERN = r"^([A-D])[\.\)\s:]\s*(.+)"
+
+OPTIONS = {"type": "pairs", "selector": ".form-check, label", "pattern": OPTION_PATTERN}
+
+# Recorder widget labels stripped from speaking cards
+SPEAKING_CLEAN = [
+    ["replace", "🎤 Ghi âm câu trả lời:", "g", ""],
+    ["replace", "⏱ Thời gian ghi âm.*", "g", ""],
+    ["replace", "⏺ Bắt đầu ghi âm", "g", ""],
+    ["replace", "⏹ Dừng ghi âm", "g", ""],
+    ["replace", "📤 Nộp bài", "g", ""],
+    ["replace", "⏱ --:--", "g", ""],
+    ["replace", r"\n{3,}", "g", "\n\n"],
+    "trim",
+]
+
+CARD_TEXT = {"type": "text", "selector": ".card-body"}
+
+LISTENING = {"type": "object", "fields": {
+    "title": {"type": "title"},
+    "audio_url": {"type": "attr", "selector": "audio source, audio", "attr": "src", "url": True,
+                  "fallback": {"type": "attr", "selector": "source", "attr": "src", "url": True}},
+    "questions": {"type": "list", "selector": ".question-block", "keep": [["options", 1]], "fields": {
+        "number": {"type": "index", "count": "all"},
+        "text": {"type": "const", "value": ""},
+        "options": OPTIONS,
+    }},
+}}
+
+READING = {"type": "object", "fields": {
+    "title": {"type": "title"},
+    "passages": {"type": "list", "selector": ".card, .passage", "keep": [["questions", 1]], "fields": {
+        "number": {"type": "index", "count": "all"},
+        "content": dict(CARD_TEXT, post=["trim", ["truncate", 3000]]),
+        "questions": {"type": "list", "selector": ".question-block", "keep": [["options", 1]], "fields": {
+            "number": {"type": "index", "count": "kept"},
+            "options": OPTIONS,
+        }},
+    }},
+}}
+
+WRITING = {"type": "object", "fields": {
+    "title": {"type": "title"},
+    "tasks": {"type": "list", "selector": ".card", "keep": [["prompt", 1]], "fields": {
+        "task_number": {"type": "index", "count": "all"},
+        "prompt": dict(CARD_TEXT, post=["trim"]),
+        "word_limit": {"type": "regex", "from": CARD_TEXT, "pattern": r"(\d+)\s*(?:words|từ)", "flags": "i",
+                       "group": 1, "post": ["int"]},
+    }},
+}}
+
+SPEAKING = {"type": "object", "fields": {
+    "title": {"type": "title"},
+    "parts": {"type": "list", "selector": ".card", "keep": [["instructions", 21], ["topic", 1]], "fields": {
+        "part_number": {"type": "index", "count": "all"},
+        "topic": {"type": "regex", "from": CARD_TEXT, "pattern": r"Topic:\s*(.+?)(?:\n|$)", "flags": "i",
+                  "group": 1, "post": ["trim"], "default": ""},
+        "instructions": dict(CARD_TEXT, post=SPEAKING_CLEAN),
+        "follow_up_questions": {
+            "type": "regex", "all": True, "pattern": r"\d+\.\s+[^\d]+", "post": ["trim"], "default": [],
+            "from": {"type": "regex", "from": CARD_TEXT, "pattern": r"Follow-up questions?:([\s\S]*?)(?:Ghi âm|$)",
+                     "flags": "i", "group": 1},
+        },
+        "speaking_time": {"type": "regex", "from": CARD_TEXT, "pattern": r"(\d+)\s*phút", "flags": "i",
+                          "group": 1, "post": ["int"]},
+    }},
+}}
+
+# ket-qua page: the correct option of each question, marked .text-success
+ANSWERS = {"type": "list", "selector": ".question-block", "keep": [["answer", 1]], "fields": {
+    "number": {"type": "index", "count": "all"},
+    "answer": {"type": "regex", "from": {"type": "text", "selector": "span.text-success", "post": ["trim"]},
+               "pattern": "^([A-D])", "group": 1},
+}}
+
+EXAM_SCHEMAS = {"listening": LISTENING, "reading": READING, "writing": WRITING, "speaking": SPEAKING}
+
+# Answer every question with its first option before submitting
+ANSWER_FIRST_OPTIONS = [{"click_first": ".question-block", "input": 'input[type="radio"]'}]
+
+# Interpreter injected into the page; mirrors parsers.extract()
+ENGINE_JS = r"""
+const regex = (pattern, flags, global) =>
+    new RegExp(pattern, (flags || '') + (global && !(flags || '').includes('g') ? 'g' : ''));
+const size = v => v == null ? 0 : (typeof v === 'object' && !Array.isArray(v) ? Object.keys(v).length : v.length);
+const post = (value, steps) => {
+    for (const step of steps || []) {
+        if (value == null) break;
+        const [name, ...args] = Array.isArray(step) ? step : [step];
+        if (Array.isArray(value)) { value = value.map(v => post(v, [step])); continue; }
+        if (name === 'trim') value = value.trim();
+        else if (name === 'int') value = parseInt(value);
+        else if (name === 'truncate') value = value.substring(0, args[0]);
+        else if (name === 'replace') value = value.replace(regex(args[0], args[1]), args[2]);
+    }
+    return value;
+};
+const evaluate = (node, ctx) => {
+    const find = () => node.selector ? ctx.querySelector(node.selector) : ctx;
+    let value = null;
+    if (node.type === 'object') {
+        value = {};
+        for (const [name, field] of Object.entries(node.fields)) value[name] = evaluate(field, ctx);
+    } else if (node.type === 'list') {
+        value = [];
+        ctx.querySelectorAll(node.selector).forEach((el, i) => {
+            const item = {};
+            for (const [name, field] of Object.entries(node.fields)) {
+                item[name] = field.type === 'index'
+                    ? (field.count === 'kept' ? value.length + 1 : i + 1)
+                    : evaluate(field, el);
+            }
+            if (!node.keep || node.keep.some(([name, min]) => size(item[name]) >= min)) value.push(item);
+        });
+    } else if (node.type === 'title') {
+        value = document.title;
+    } else if (node.type === 'text') {
+        const el = find();
+        value = el ? el.innerText : '';
+    } else if (node.type === 'attr') {
+        const el = find();
+        if (el) {
+            value = (node.url ? el[node.attr] : el.getAttribute(node.attr)) || null;
+            if (value == null && node.fallback) value = evaluate(node.fallback, el);
+        }
+    } else if (node.type === 'regex') {
+        const text = evaluate(node.from, ctx);
+        if (text != null) {
+            if (node.all) {
+                value = text.match(regex(node.pattern, node.flags, true));
+            } else {
+                const m = text.match(regex(node.pattern, node.flags));
+                value = m ? m[node.group || 0] : null;
+            }
+        }
+    } else if (node.type === 'pairs') {
+        value = {};
+        ctx.querySelectorAll(node.selector).forEach(el => {
+            const m = el.innerText.trim().match(regex(node.pattern));
+            if (m) value[m[1]] = m[2].trim();
+        });
+    } else if (node.type === 'const') {
+        value = node.value;
+    }
+    value = post(value, node.post);
+    return value == null && 'default' in node ? node.default : value;
+};
+"""
+
+# Same checks as main.page_status(), plus the work of the page state
+STATE_JS = """
+(args) => {
+    const url = location.href;
+    const html = document.documentElement.outerHTML;
+    let status = 'ok';
+    if (url.includes('/dang-nhap')) status = 'login';
+    else if (url.includes('/tai-khoan')) status = 'invalid';
+    else if ((args.markers || []).some(m => html.includes(m))) status = 'vip';
+    const result = { url: url, status: status, data: null };
+    if (status === 'ok') {
+        result.data = evaluate(__SCHEMA__, document);
+        if (args.act) {
+            for (const action of __ACTIONS__) {
+                document.querySelectorAll(action.click_first).forEach(block => {
+                    const input = block.querySelector(action.input);
+                    if (input) input.click();
+                });
+            }
+            window.confirm = () => true;
+        }
+    }
+    if (args.html) result.html = html;
+    return result;
+}
+"""
+
+
+@lru_cache(maxsize=None)
+def _compile(schema_json: str, actions_json: str) -> str:
+    body = STATE_JS.replace("__SCHEMA__", schema_json).replace("__ACTIONS__", actions_json)
+    return "(args) => {\n" + ENGINE_JS + "\nreturn (" + body.strip() + ")(args);\n}"
+
+
+def compile_script(schema: Dict, actions=None) -> str:
+    """One page.evaluate() function for a page state, called with
+    {markers, act, html}; returns {url, status, data, html?}"""
+    return _compile(json.dumps(schema, ensure_ascii=False), json.dumps(actions or []))
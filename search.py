@@ -0,0 +1,417 @@
+# -*- coding: utf-8 -*-
+"""
+Search index over scraped exams - which exams contain a question option,
+passage snippet, writing prompt or speaking topic / follow-up question.
+
+The index is a directory of immutable segment files listed in segments.json.
+Each segment holds a doc table, a sorted term table and delta/varint coded
+postings, and is read through mmap. Tokens are lowercased and stripped of
+diacritics, so "không" and "khong" match. New exams go into new segments
+(the scraper adds them as it saves, see main.py --search-index); a later
+copy of an exam hides earlier ones, and segments are merged once there are
+too many of them.
+
+Build from an output, query and compact:
+  python search.py build files:data --index data/search
+  python search.py query "climate change" --type reading
+  python search.py compact
+"""
+
+import argparse
+import itertools
+import json
+import mmap
+import os
+import re
+import struct
+import time
+import unicodedata
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # no cross-process locking (Windows): one writer at a time
+
+from sinks import parse_spec
+
+EXAM_TYPES = ["listening", "reading", "writing", "speaking"]
+TYPE_CODES = {t: i for i, t in enumerate(EXAM_TYPES)}
+
+DEFAULT_INDEX = os.path.join("data", "search")
+DEFAULT_FLUSH_DOCS = 500
+MAX_SEGMENTS = 8
+
+MAGIC = b"VSTIDX01"
+# magic, docs, terms, then offsets of the doc table, term table, term strings and postings
+HEADER = struct.Struct("<8sIIQQQQ")
+# exam type code, exam ID
+DOC = struct.Struct("<BI")
+# string offset, string length, document frequency, postings offset, postings length
+TERM = struct.Struct("<IHIQI")
+
+_TOKEN = re.compile(r"\w+")
+
+# Segment numbers, unique within the process (several writers may share a second)
+_segment_numbers = itertools.count(1)
+
+
+class Hit(NamedTuple):
+    exam_type: str
+    exam_id: int
+    score: int  # query tokens the exam contains
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip diacritics (Vietnamese đ becomes d)"""
+    decomposed = unicodedata.normalize("NFD", text.lower())
+    stripped = "".join(c for c in decomposed if unicodedata.category(c) != "Mn")
+    return stripped.replace("đ", "d")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(fold(text))
+
+
+def searchable_text(record: Dict) -> Iterator[str]:
+    """The indexed fields of an exam record"""
+    for q in record.get("questions") or []:
+        yield from (q.get("options") or {}).values()
+    for p in record.get("passages") or []:
+        yield p.get("content") or ""
+        for q in p.get("questions") or []:
+            yield from (q.get("options") or {}).values()
+    for task in record.get("tasks") or []:
+        yield task.get("prompt") or ""
+    for part in record.get("parts") or []:
+        yield part.get("topic") or ""
+        yield from part.get("follow_up_questions") or []
+
+
+def _encode_postings(doc_numbers: List[int]) -> bytes:
+    out = bytearray()
+    previous = 0
+    for number in doc_numbers:
+        delta = number - previous
+        previous = number
+        while delta >= 0x80:
+            out.append(delta & 0x7F | 0x80)
+            delta >>= 7
+        out.append(delta)
+    return bytes(out)
+
+
+def _decode_postings(buf, offset: int, length: int) -> List[int]:
+    result = []
+    value = shift = previous = 0
+    for byte in buf[offset:offset + length]:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            previous += value
+            result.append(previous)
+            value = shift = 0
+    return result
+
+
+def write_segment(path: str, docs: List[Tuple[int, int]], postings: Dict[str, List[int]]):
+    """Write one segment: docs[i] = (type code, exam ID), postings = term -> sorted doc numbers"""
+    terms = sorted((term.encode("utf-8"), numbers) for term, numbers in postings.items())
+    strings = bytearray()
+    blob = bytearray()
+    table = bytearray()
+    for term, numbers in terms:
+        encoded = _encode_postings(numbers)
+        table += TERM.pack(len(strings), len(term), len(numbers), len(blob), len(encoded))
+        strings += term
+        blob += encoded
+    doc_table = b"".join(DOC.pack(code, exam_id) for code, exam_id in docs)
+
+    docs_offset = HEADER.size
+    terms_offset = docs_offset + len(doc_table)
+    strings_offset = terms_offset + len(table)
+    postings_offset = strings_offset + len(strings)
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(docs), len(terms), docs_offset, terms_offset,
+                            strings_offset, postings_offset))
+        f.write(doc_table)
+        f.write(table)
+        f.write(strings)
+        f.write(blob)
+    os.replace(tmp, path)
+
+
+class Segment:
+    """Read-only view of a segment file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.doc_count, self.term_count, docs_offset, self.terms_offset,
+         self.strings_offset, self.postings_offset) = HEADER.unpack_from(self.buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a search index segment")
+        self.docs = [DOC.unpack_from(self.buf, docs_offset + i * DOC.size) for i in range(self.doc_count)]
+
+    def _entry(self, i: int) -> Tuple[bytes, int, int, int]:
+        string_offset, string_length, df, offset, length = TERM.unpack_from(self.buf, self.terms_offset + i * TERM.size)
+        start = self.strings_offset + string_offset
+        return self.buf[start:start + string_length], df, offset, length
+
+    def postings(self, term: str) -> List[int]:
+        """Doc numbers containing term (binary search over the term table)"""
+        key = term.encode("utf-8")
+        lo, hi = 0, self.term_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._entry(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.term_count:
+            return []
+        found, _, offset, length = self._entry(lo)
+        if found != key:
+            return []
+        return _decode_postings(self.buf, self.postings_offset + offset, length)
+
+    def terms(self) -> Iterator[Tuple[str, List[int]]]:
+        for i in range(self.term_count):
+            term, _, offset, length = self._entry(i)
+            yield term.decode("utf-8"), _decode_postings(self.buf, self.postings_offset + offset, length)
+
+    def close(self):
+        self.buf.close()
+
+
+def _read_segment_list(root: str) -> List[str]:
+    try:
+        with open(os.path.join(root, "segments.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)["segments"]
+    except FileNotFoundError:
+        return []
+
+
+def _live_docs(segments: List[Segment]) -> List[Set[int]]:
+    """Per segment, the doc numbers not replaced by a later segment"""
+    latest: Dict[Tuple[int, int], Tuple[int, int]] = {}
+    for si, segment in enumerate(segments):
+        for number, key in enumerate(segment.docs):
+            latest[key] = (si, number)
+    live: List[Set[int]] = [set() for _ in segments]
+    for si, number in latest.values():
+        live[si].add(number)
+    return live
+
+
+class SearchIndex:
+    """Query side: opens the current segments; reload() picks up new ones"""
+
+    def __init__(self, root: str = DEFAULT_INDEX):
+        self.root = root
+        self.segments: List[Segment] = []
+        self.live: List[Set[int]] = []
+        self.reload()
+
+    def reload(self):
+        self.close()
+        self.segments = [Segment(os.path.join(self.root, name)) for name in _read_segment_list(self.root)]
+        self.live = _live_docs(self.segments)
+
+    def __len__(self) -> int:
+        return sum(len(live) for live in self.live)
+
+    def search(self, query: str, exam_type: Optional[str] = None, match_all: bool = True,
+               limit: Optional[int] = None) -> List[Hit]:
+        """Exams containing every token of query (match_all) or any of them,
+        best matches first, then by type and ID"""
+        tokens = sorted(set(tokenize(query)))
+        if not tokens:
+            return []
+        code = TYPE_CODES[exam_type] if exam_type else None
+        scores: Dict[Tuple[int, int], int] = {}
+        for segment, live in zip(self.segments, self.live):
+            counts: Dict[int, int] = {}
+            for token in tokens:
+                for number in segment.postings(token):
+                    counts[number] = counts.get(number, 0) + 1
+            for number, count in counts.items():
+                if number not in live or (match_all and count < len(tokens)):
+                    continue
+                key = segment.docs[number]
+                if code is None or key[0] == code:
+                    scores[key] = count
+        hits = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [Hit(EXAM_TYPES[code], exam_id, score) for (code, exam_id), score in hits[:limit]]
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+
+
+class IndexWriter:
+    """Adds exams to the index in new segments of up to flush_docs exams.
+
+    With replace=True the index ends up holding only the exams added by
+    this writer (a full rebuild); with replace_type as well, only exams of
+    that type are replaced and the other types are kept. Otherwise exams
+    are added to what is there.
+    """
+
+    def __init__(self, root: str = DEFAULT_INDEX, flush_docs: int = DEFAULT_FLUSH_DOCS,
+                 max_segments: int = MAX_SEGMENTS, replace: bool = False,
+                 replace_type: Optional[str] = None):
+        self.root = root
+        self.flush_docs = flush_docs
+        self.max_segments = max_segments
+        self.replace = replace
+        self.replace_type = replace_type
+        self.written: List[str] = []
+        self._docs: List[Tuple[int, int]] = []
+        self._postings: Dict[str, List[int]] = {}
+        os.makedirs(root, exist_ok=True)
+
+    def add(self, record: Dict):
+        number = len(self._docs)
+        self._docs.append((TYPE_CODES[record["exam_type"]], int(record["exam_id"])))
+        tokens: Set[str] = set()
+        for text in searchable_text(record):
+            tokens.update(tokenize(text))
+        for token in tokens:
+            self._postings.setdefault(token, []).append(number)
+        if len(self._docs) >= self.flush_docs:
+            self.flush()
+
+    def _segment_name(self) -> str:
+        return f"seg-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_segment_numbers):04d}.idx"
+
+    def _update(self, change):
+        """Apply change(segment names) -> segment names under the index lock"""
+        with open(os.path.join(self.root, "lock"), 'a') as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            before = _read_segment_list(self.root)
+            after = change(before)
+            tmp = os.path.join(self.root, "segments.json.tmp")
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({"segments": after}, f)
+            os.replace(tmp, os.path.join(self.root, "segments.json"))
+            for name in set(before) - set(after):
+                os.remove(os.path.join(self.root, name))
+
+    def flush(self):
+        """Write the buffered exams as a new segment"""
+        if not self._docs:
+            return
+        name = self._segment_name()
+        write_segment(os.path.join(self.root, name), self._docs, self._postings)
+        self._docs, self._postings = [], {}
+        self.written.append(name)
+        self._update(lambda names: names + [name])
+        if len(_read_segment_list(self.root)) > self.max_segments:
+            self.compact()
+
+    def compact(self):
+        """Merge every segment into one, dropping replaced copies of exams"""
+        name = self._segment_name()
+
+        def merge(names: List[str]) -> List[str]:
+            if self.replace and not self.replace_type:
+                names = [n for n in names if n in self.written]
+            if len(names) < 2 and not self.replace:
+                return names
+            segments = [Segment(os.path.join(self.root, n)) for n in names]
+            try:
+                live = _live_docs(segments)
+                if self.replace_type:
+                    # Older segments keep only the types this writer is not rebuilding
+                    code = TYPE_CODES[self.replace_type]
+                    for n, segment, numbers in zip(names, segments, live):
+                        if n not in self.written:
+                            numbers.difference_update([d for d in numbers if segment.docs[d][0] == code])
+                keys = sorted(segment.docs[number] for segment, numbers in zip(segments, live)
+                              for number in numbers)
+                new_numbers = {key: i for i, key in enumerate(keys)}
+                postings: Dict[str, List[int]] = {}
+                for segment, numbers in zip(segments, live):
+                    for term, docs in segment.terms():
+                        moved = [new_numbers[segment.docs[d]] for d in docs if d in numbers]
+                        if moved:
+                            postings.setdefault(term, []).extend(moved)
+                for docs in postings.values():
+                    docs.sort()
+                write_segment(os.path.join(self.root, name), keys, postings)
+                self.written.append(name)
+            finally:
+                for segment in segments:
+                    segment.close()
+            return [name]
+
+        self._update(merge)
+
+    def close(self):
+        self.flush()
+        if self.replace:
+            self.compact()
+
+
+def build(source_spec: str, root: str, exam_type: Optional[str] = None) -> int:
+    """Rebuild the index from a scraper output ('format:location'); with
+    exam_type only that type is rebuilt"""
+    source = parse_spec(source_spec)
+    writer = IndexWriter(root, replace=True, replace_type=exam_type)
+    total = 0
+    try:
+        for record in source.read(exam_type):
+            writer.add(record)
+            total += 1
+    finally:
+        source.close()
+    writer.close()
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and query the exam search index")
+    parser.add_argument("--index", default=DEFAULT_INDEX, help=f"Index directory (default {DEFAULT_INDEX})")
+    # --index is accepted after the command too
+    index_arg = argparse.ArgumentParser(add_help=False)
+    index_arg.add_argument("--index", default=argparse.SUPPRESS, help=f"Index directory (default {DEFAULT_INDEX})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_cmd = commands.add_parser("build", parents=[index_arg], help="Rebuild the index from a scraper output")
+    build_cmd.add_argument("source", nargs="?", default="files:data",
+                           help="format:location of the output, as for sinks.py (default files:data)")
+    build_cmd.add_argument("--type", choices=EXAM_TYPES, help="Only rebuild this exam type, keep the others")
+    query_cmd = commands.add_parser("query", parents=[index_arg], help="Exams containing the given words")
+    query_cmd.add_argument("text")
+    query_cmd.add_argument("--type", choices=EXAM_TYPES, help="Only return this exam type")
+    query_cmd.add_argument("--any", action="store_true", help="Match any word, most matching words first")
+    query_cmd.add_argument("--limit", type=int, default=50)
+    commands.add_parser("compact", parents=[index_arg], help="Merge all segments into one")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        started = time.monotonic()
+        total = build(args.source, args.index, args.type)
+        print(f"Indexed {total} exams from {args.source} in {time.monotonic() - started:.1f}s")
+    elif args.command == "compact":
+        IndexWriter(args.index).compact()
+    else:
+        index = SearchIndex(args.index)
+        try:
+            started = time.perf_counter()
+            hits = index.search(args.text, args.type, match_all=not args.any, limit=args.limit)
+            elapsed = (time.perf_counter() - started) * 1000
+            for hit in hits:
+                print(f"{hit.exam_type:10} {hit.exam_id:>6}" + (f"  {hit.score}" if args.any else ""))
+            print(f"{len(hits)} of {len(index)} exams ({elapsed:.1f} ms)")
+        finally:
+            index.close()
+
+
+if __name__ == "__main__":
+    main()
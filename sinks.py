@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+Output sinks - where scraped exam records are stored
+  files      one pretty-printed JSON file per exam (data/<type>/<id>.json)
+  jsonl      append-only data/<type>.jsonl, optionally .gz or .zst compressed
+  sqlite     data/exams.sqlite, one row per exam
+Records are written in batches from a background thread (BatchWriter)
+
+Convert between formats:
+  python sinks.py files:data sqlite:data/exams.sqlite
+"""
+
+import argparse
+import gzip
+import io
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, Optional
+
+from manifest import content_hash
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # jsonl.zst needs: pip install zstandard
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ["files", "jsonl", "jsonl.gz", "jsonl.zst", "sqlite"]
+
+
+class Sink:
+    """Destination for exam records (dicts with exam_type and exam_id)"""
+
+    def write_batch(self, records: List[Dict]):
+        raise NotImplementedError
+
+    def read(self, exam_type: Optional[str] = None) -> Iterator[Dict]:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class FileSink(Sink):
+    """One indented JSON file per exam, the original layout"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, exam_type: str, exam_id) -> str:
+        return os.path.join(self.root, exam_type, f"{exam_id}.json")
+
+    def write_batch(self, records: List[Dict]):
+        for data in records:
+            filepath = self.path(data["exam_type"], data["exam_id"])
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            with open(filepath, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+
+    def read(self, exam_type: Optional[str] = None) -> Iterator[Dict]:
+        if not os.path.isdir(self.root):
+            return
+        types = [exam_type] if exam_type else sorted(os.listdir(self.root))
+        for t in types:
+            directory = os.path.join(self.root, t)
+            if not os.path.isdir(directory):
+                continue
+            names = [n for n in os.listdir(directory) if n.endswith(".json") and n[:-5].isdigit()]
+            for name in sorted(names, key=lambda n: int(n[:-5])):
+                with open(os.path.join(directory, name), 'r', encoding='utf-8') as f:
+                    yield json.load(f)
+
+
+class JsonlSink(Sink):
+    """Append-only JSON lines per exam type; each batch is one gzip member or zstd frame"""
+
+    def __init__(self, root: str, compression: Optional[str] = None):
+        if compression == "zst" and zstandard is None:
+            raise ValueError("jsonl.zst output needs the zstandard package (pip install zstandard)")
+        self.root = root
+        self.compression = compression
+
+    def path(self, exam_type: str) -> str:
+        suffix = f".{self.compression}" if self.compression else ""
+        return os.path.join(self.root, f"{exam_type}.jsonl{suffix}")
+
+    def write_batch(self, records: List[Dict]):
+        by_type: Dict[str, List[str]] = {}
+        for data in records:
+            by_type.setdefault(data["exam_type"], []).append(json.dumps(data, ensure_ascii=False))
+        os.makedirs(self.root, exist_ok=True)
+        for exam_type, lines in by_type.items():
+            payload = ("\n".join(lines) + "\n").encode("utf-8")
+            with open(self.path(exam_type), 'ab') as f:
+                if self.compression == "gz":
+                    f.write(gzip.compress(payload))
+                elif self.compression == "zst":
+                    f.write(zstandard.ZstdCompressor().compress(payload))
+                else:
+                    f.write(payload)
+
+    def _open_text(self, path: str) -> io.TextIOBase:
+        raw = open(path, 'rb')
+        if self.compression == "gz":
+            stream = gzip.GzipFile(fileobj=raw)
+        elif self.compression == "zst":
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+        else:
+            stream = raw
+        return io.TextIOWrapper(stream, encoding='utf-8')
+
+    def read(self, exam_type: Optional[str] = None) -> Iterator[Dict]:
+        if not os.path.isdir(self.root):
+            return
+        suffix = f".jsonl.{self.compression}" if self.compression else ".jsonl"
+        types = [exam_type] if exam_type else sorted(
+            n[:-len(suffix)] for n in os.listdir(self.root) if n.endswith(suffix))
+        for t in types:
+            path = self.path(t)
+            if not os.path.exists(path):
+                continue
+            with self._open_text(path) as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+
+class SqliteSink(Sink):
+    """One row per exam, indexed by (type, id) and by content hash"""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        # Written from the BatchWriter thread only
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS exams (
+                exam_type TEXT NOT NULL,
+                exam_id INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                scraped_at TEXT,
+                data TEXT NOT NULL,
+                PRIMARY KEY (exam_type, exam_id)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS exams_content_hash ON exams (content_hash)")
+        self.conn.commit()
+
+    def write_batch(self, records: List[Dict]):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO exams VALUES (?, ?, ?, ?, ?)",
+            [(d["exam_type"], int(d["exam_id"]), content_hash(d), d.get("scraped_at"),
+              json.dumps(d, ensure_ascii=False)) for d in records])
+        self.conn.commit()
+
+    def read(self, exam_type: Optional[str] = None) -> Iterator[Dict]:
+        if exam_type:
+            rows = self.conn.execute(
+                "SELECT data FROM exams WHERE exam_type = ? ORDER BY exam_id", (exam_type,))
+        else:
+            rows = self.conn.execute("SELECT data FROM exams ORDER BY exam_type, exam_id")
+        for (data,) in rows:
+            yield json.loads(data)
+
+    def close(self):
+        self.conn.close()
+
+
+def open_sink(fmt: str, location: str) -> Sink:
+    """Sink for a format; location is the output directory (or the .sqlite file)"""
+    if fmt == "files":
+        return FileSink(location)
+    if fmt.startswith("jsonl"):
+        compression = fmt.split(".", 1)[1] if "." in fmt else None
+        return JsonlSink(location, compression)
+    if fmt == "sqlite":
+        if not location.endswith((".sqlite", ".db")):
+            location = os.path.join(location, "exams.sqlite")
+        return SqliteSink(location)
+    raise ValueError(f"Unknown output format: {fmt} (choose from {', '.join(FORMATS)})")
+
+
+class BatchWriter:
+    """Writes records to a sink in batches from a background thread.
+
+    write() only enqueues, so the scraper never waits on disk unless the
+    queue (max_pending records) is full. A write error is raised again
+    from the next write(), flush() or close().
+    """
+
+    def __init__(self, sink: Sink, batch_size: int = 100, flush_interval: float = 1.0,
+                 max_pending: int = 10000):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: queue.Queue = queue.Queue(max_pending)
+        self.error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name="sink-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                first = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            if first is None:
+                self.queue.task_done()
+                return
+            batch = [first]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                self.sink.write_batch(batch)
+            except BaseException as e:
+                logger.error(f"Writing {len(batch)} records failed: {e}")
+                self.error = e
+            for _ in range(len(batch) + stop):
+                self.queue.task_done()
+            if stop:
+                return
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def write(self, data: Dict):
+        self._raise_error()
+        self.queue.put(data)
+
+    def flush(self):
+        """Block until every queued record is written"""
+        self.queue.join()
+        self._raise_error()
+
+    def read(self, exam_type: Optional[str] = None) -> Iterator[Dict]:
+        self.flush()
+        return self.sink.read(exam_type)
+
+    def close(self):
+        if self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join()
+        self.sink.close()
+        self._raise_error()
+
+
+def convert(source: Sink, target: Sink, exam_type: Optional[str] = None, batch_size: int = 500) -> int:
+    """Copy every record from one sink to another"""
+    batch: List[Dict] = []
+    total = 0
+    for data in source.read(exam_type):
+        batch.append(data)
+        if len(batch) >= batch_size:
+            target.write_batch(batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        target.write_batch(batch)
+        total += len(batch)
+    return total
+
+
+def parse_spec(spec: str) -> Sink:
+    """'format:location', e.g. files:data, jsonl.gz:out, sqlite:data/exams.sqlite"""
+    fmt, _, location = spec.partition(":")
+    return open_sink(fmt, location or "data")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert scraped exams between output formats")
+    parser.add_argument("source", help=f"format:location, format one of {', '.join(FORMATS)}")
+    parser.add_argument("target", help="format:location to write to")
+    parser.add_argument("--type", help="Only convert this exam type")
+    args = parser.parse_args()
+
+    source, target = parse_spec(args.source), parse_spec(args.target)
+    try:
+        total = convert(source, target, args.type)
+    finally:
+        source.close()
+        target.close()
+    print(f"Converted {total} exams from {args.source} to {args.target}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Round trip through the on-disk search index: build, query, add, rebuild one type"""
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from search import IndexWriter, SearchIndex, build  # noqa: E402
+from sinks import FileSink  # noqa: E402
+
+EXAMS = [
+    {"exam_type": "listening", "exam_id": 1,
+     "questions": [{"options": {"A": "Climate change talk", "B": "A museum visit"}}]},
+    {"exam_type": "reading", "exam_id": 2,
+     "passages": [{"content": "Climate change and the Mekong delta", "questions": []}]},
+    {"exam_type": "writing", "exam_id": 3, "tasks": [{"prompt": "Write about climate change"}]},
+    {"exam_type": "speaking", "exam_id": 4,
+     "parts": [{"topic": "Biến đổi khí hậu", "follow_up_questions": ["Why does climate matter?"]}]},
+]
+
+
+def _hits(root, query, exam_type=None):
+    index = SearchIndex(root)
+    try:
+        return [(h.exam_type, h.exam_id) for h in index.search(query, exam_type)]
+    finally:
+        index.close()
+
+
+def test_build_query_add_and_type_rebuild(tmp_path):
+    data, root = str(tmp_path / "data"), str(tmp_path / "search")
+    FileSink(data).write_batch(EXAMS)
+
+    assert build(f"files:{data}", root) == 4
+    assert _hits(root, "climate") == [("listening", 1), ("reading", 2), ("writing", 3), ("speaking", 4)]
+    assert _hits(root, "bien doi khi hau") == [("speaking", 4)]
+    assert _hits(root, "climate", "reading") == [("reading", 2)]
+
+    # Incremental add: a later copy of an exam hides the earlier one
+    writer = IndexWriter(root)
+    writer.add({"exam_type": "reading", "exam_id": 2,
+                "passages": [{"content": "Coral reefs", "questions": []}]})
+    writer.add({"exam_type": "writing", "exam_id": 5, "tasks": [{"prompt": "Coral reefs again"}]})
+    writer.close()
+    assert _hits(root, "coral") == [("reading", 2), ("writing", 5)]
+    assert ("reading", 2) not in _hits(root, "climate")
+
+    # Rebuilding one type keeps every other type's exams
+    FileSink(data).write_batch([{"exam_type": "reading", "exam_id": 6,
+                                 "passages": [{"content": "Climate refugees", "questions": []}]}])
+    assert build(f"files:{data}", root, "reading") == 2
+    assert _hits(root, "climate") == [("listening", 1), ("reading", 2), ("reading", 6),
+                                      ("writing", 3), ("speaking", 4)]
+    assert _hits(root, "coral") == [("writing", 5)]
+
+
+def test_index_option_after_command(tmp_path):
+    data, root = str(tmp_path / "data"), str(tmp_path / "search")
+    FileSink(data).write_batch(EXAMS)
+    for args in (["build", f"files:{data}", "--index", root], ["query", "climate", "--index", root]):
+        result = subprocess.run([sys.executable, os.path.join(ROOT, "search.py")] + args,
+                                capture_output=True, text=True, cwd=ROOT)
+        assert result.returncode == 0, result.stderr
+    assert "4 of 4 exams" in result.stdout
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Shared work queue - lets several scraper processes (on one or more machines)
+split a crawl. Every worker leases (exam_type, exam_id) tasks from one SQLite
+file; a lease that is not renewed expires and the task goes to another worker.
+
+Show progress:
+  python workqueue.py data/queue.sqlite
+"""
+
+import argparse
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+DEFAULT_LEASE_SECONDS = 300.0
+MAX_ATTEMPTS = 3
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """Parse 'i/n' (0 <= i < n) for --shard"""
+    index, _, count = value.partition("/")
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/n, got {value!r}")
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be in 0..{count - 1}")
+    return index, count
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LeaseQueue:
+    """SQLite-backed task queue with expiring leases.
+
+    Every worker can enqueue the same IDs (existing tasks are kept, done ones
+    stay done), so all workers are started with identical arguments. A
+    failed task goes back to pending; one leased MAX_ATTEMPTS times without
+    finishing is given up on until reopen_failed().
+
+    Calls block on other workers' write locks (up to 60 s), so the crawl
+    runs them in threads; a lock keeps those calls apart on the connection.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                 worker_id: Optional[str] = None):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.worker_id = worker_id or default_worker_id()
+        self.poll_interval = min(10.0, lease_seconds / 4)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # Autocommit; leasing takes an explicit write lock
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        # Rollback journal: WAL needs shared memory, which network filesystems do not provide
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                exam_type TEXT NOT NULL,
+                exam_id INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                worker TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (exam_type, exam_id)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS tasks_state ON tasks (exam_type, state, exam_id)")
+
+    def enqueue(self, exam_type: str, exam_ids: Iterable[int]) -> int:
+        """Add tasks not queued yet; returns how many were new"""
+        with self._lock:
+            before = self.conn.total_changes
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO tasks (exam_type, exam_id, state) VALUES (?, ?, ?)",
+                ((exam_type, i, PENDING) for i in exam_ids))
+            self.conn.execute("COMMIT")
+            return self.conn.total_changes - before
+
+    def lease(self, exam_type: str) -> Optional[int]:
+        """Take the lowest pending (or abandoned) task, or None when there is none right now"""
+        with self._lock:
+            now = time.time()
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("""
+                    SELECT exam_id FROM tasks
+                    WHERE exam_type = ? AND attempts < ?
+                      AND (state = ? OR (state = ? AND lease_expires < ?))
+                    ORDER BY exam_id LIMIT 1
+                """, (exam_type, MAX_ATTEMPTS, PENDING, LEASED, now)).fetchone()
+                if row:
+                    self.conn.execute("""
+                        UPDATE tasks SET state = ?, worker = ?, lease_expires = ?, attempts = attempts + 1
+                        WHERE exam_type = ? AND exam_id = ?
+                    """, (LEASED, self.worker_id, now + self.lease_seconds, exam_type, row[0]))
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            return row[0] if row else None
+
+    def renew(self):
+        """Extend every lease this worker holds (heartbeat)"""
+        with self._lock:
+            self.conn.execute(
+                "UPDATE tasks SET lease_expires = ? WHERE worker = ? AND state = ?",
+                (time.time() + self.lease_seconds, self.worker_id, LEASED))
+
+    def reopen_failed(self, exam_type: str, exam_ids: Iterable[int]) -> int:
+        """Give given-up tasks (failed MAX_ATTEMPTS times) a new set of attempts"""
+        with self._lock:
+            before = self.conn.total_changes
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.executemany("""
+                UPDATE tasks SET state = ?, worker = NULL, lease_expires = NULL, attempts = 0
+                WHERE exam_type = ? AND exam_id = ? AND state != ? AND attempts >= ?
+                  AND NOT (state = ? AND lease_expires >= ?)
+            """, ((PENDING, exam_type, i, DONE, MAX_ATTEMPTS, LEASED, time.time()) for i in exam_ids))
+            self.conn.execute("COMMIT")
+            return self.conn.total_changes - before
+
+    def complete(self, exam_type: str, exam_id: int):
+        with self._lock:
+            self.conn.execute(
+                "UPDATE tasks SET state = ?, lease_expires = NULL WHERE exam_type = ? AND exam_id = ?",
+                (DONE, exam_type, exam_id))
+
+    def fail(self, exam_type: str, exam_id: int):
+        """Put a failed task back for another attempt (by any worker)"""
+        with self._lock:
+            self.conn.execute(
+                "UPDATE tasks SET state = ?, worker = NULL, lease_expires = NULL WHERE exam_type = ? AND exam_id = ?",
+                (PENDING, exam_type, exam_id))
+
+    def release(self):
+        """Hand back unfinished leases so other workers need not wait for them to expire"""
+        with self._lock:
+            self.conn.execute(
+                "UPDATE tasks SET state = ?, worker = NULL, lease_expires = NULL, attempts = attempts - 1 "
+                "WHERE worker = ? AND state = ?", (PENDING, self.worker_id, LEASED))
+
+    def outstanding(self, exam_type: str) -> int:
+        """Tasks not finished yet that may still be leased (by anyone)"""
+        with self._lock:
+            row = self.conn.execute("""
+                SELECT COUNT(*) FROM tasks
+                WHERE exam_type = ? AND state != ?
+                  AND (attempts < ? OR (state = ? AND lease_expires >= ?))
+            """, (exam_type, DONE, MAX_ATTEMPTS, LEASED, time.time())).fetchone()
+            return row[0]
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        """Task count per exam type and state, with expired and given-up leases apart"""
+        with self._lock:
+            result: Dict[str, Dict[str, int]] = {}
+            rows = self.conn.execute("""
+                SELECT exam_type,
+                       CASE WHEN state = :pending AND attempts >= :max THEN 'given up'
+                            WHEN state = :leased AND lease_expires < :now AND attempts >= :max THEN 'given up'
+                            WHEN state = :leased AND lease_expires < :now THEN 'expired'
+                            ELSE state END,
+                       COUNT(*)
+                FROM tasks GROUP BY 1, 2
+            """, {"pending": PENDING, "leased": LEASED, "now": time.time(), "max": MAX_ATTEMPTS})
+            for exam_type, state, n in rows:
+                result.setdefault(exam_type, {})[state] = n
+            return result
+
+    def close(self):
+        self.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the progress of a shared work queue")
+    parser.add_argument("path", help="Queue file passed to main.py --queue")
+    args = parser.parse_args()
+
+    queue = LeaseQueue(args.path)
+    try:
+        for exam_type, states in sorted(queue.counts().items()):
+            print(f"{exam_type:10} " + "  ".join(f"{s}={n}" for s, n in sorted(states.items())))
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()